@@ -1,8 +1,73 @@
+import functools
+import traceback
 from ClyphX_Pro.clyphx_pro.UserActionsBase import UserActionsBase
-from _utils import catch_exception, clear_log_file
+from _utils import catch_exception
+from _Log import logger, DEBUG, INFO, ERROR
 from _Set import Set
 from _Socket import Socket
 from _GetState import get_state
+from _Metrics import timed, record, timer
+from _SnapControl import RAMP_CURVES
+
+#Actions that can be run over the socket: the Set method of the same name and how its argument is read
+SOCKET_ACTIONS = {
+    'activate_module': 'index',
+    'toggle_input': 'name',
+    'select_instrument': 'index',
+    'deselect_instrument': 'index',
+    'stop_instrument': 'index',
+    'select_loop': 'key',
+    'deselect_loop': 'key',
+    'stop_loop': 'key',
+    'stop_all_loops': None,
+    'clear_loop': 'key',
+    'mute_all_loops': None,
+    'unmute_all_loops': None,
+    'quantize_loop': 'key',
+    'select_snap': 'index',
+    'deselect_snap': 'index',
+    'assign_snap': 'index',
+    'clear_snap': 'index',
+    'recall_snap': 'ramp',
+    'select_global_instrument': 'index',
+    'deselect_global_instrument': 'index',
+    'select_global_loop': None,
+    'stop_global_loop': None,
+    'clear_global_loop': None,
+    'toggle_metronome': None,
+}
+
+#Indexes are 1-based in actions; 0 or less would wrap around to the end of the list
+def parse_index(args):
+    index = int(args)
+    if index < 1:
+        raise ValueError('Index must be 1 or more, got %s' % index)
+    return index - 1
+
+#Ramp arguments are the number of bars and optionally a curve: linear, exp or s
+def parse_ramp_args(args):
+    parts = str(args).split() if args else []
+    beats = int(parts[0])*4 if parts else 0
+    curve = parts[1].lower() if len(parts) > 1 else 'linear'
+    if curve not in RAMP_CURVES:
+        raise ValueError('Unknown ramp curve %s, expected one of %s' % (curve, ', '.join(sorted(RAMP_CURVES))))
+    return beats, curve
+
+#Runs an action as one Set batch, so its Live writes and router updates are applied once,
+#and records its latency, writes included, as action.{name}
+def set_action(f):
+    name = 'action.' + f.__name__
+    @functools.wraps(f)
+    def func(self, *args):
+        start = timer()
+        try:
+            if self.set:
+                with self.set.batch():
+                    return f(self, *args)
+            return f(self, *args)
+        finally:
+            record(name, (timer() - start) * 1000)
+    return func
 
 #This file is the entry point to the control surface script, and defines/routes the available actions
 class EbiagiBase(UserActionsBase):
@@ -16,9 +81,16 @@ class EbiagiBase(UserActionsBase):
     @catch_exception
     def create_actions(self):
 
-        clear_log_file()
+        logger.set_sink(self.canonical_parent.log_message)
+        logger.clear_file()
         self.log('initializing Ebiagi...')
 
+        #Buffered log lines are written out once per tick, outside of actions
+        def flush_log():
+            logger.flush()
+            self.canonical_parent.schedule_message(1, flush_log)
+        flush_log()
+
         self.add_global_action('rebuild_set', self.rebuild_set)
         self.add_global_action('activate_module', self.activate_module)
         self.add_global_action('toggle_input', self.toggle_input)
@@ -49,122 +121,192 @@ class EbiagiBase(UserActionsBase):
 
     @catch_exception
     def rebuild_set(self, action_def, args):
+        if self.set:
+            self.set.disconnect()
         self.set = Set()
+        if self.socket:
+            self.set.add_state_listener(self.socket.state_changed)
+            self.socket.state_changed()
 
     @catch_exception
+    @set_action
     def activate_module(self, action_def, args):
-        index = int(args[-1]) - 1
+        index = parse_index(args[-1])
         self.set.activate_module(index)
 
     @catch_exception
+    @set_action
     def toggle_input(self, action_def, args):
         self.set.toggle_input(args.upper())
 
     @catch_exception
+    @set_action
     def select_instrument(self, action_def, args):
-        index = int(args[-1]) - 1
+        index = parse_index(args[-1])
         self.set.select_instrument(index)
 
     @catch_exception
+    @set_action
     def deselect_instrument(self, action_def, args):
-        index = int(args[-1]) - 1
+        index = parse_index(args[-1])
         self.set.deselect_instrument(index)
 
     @catch_exception
+    @set_action
     def stop_instrument(self, action_def, args):
-        index = int(args[-1]) - 1
+        index = parse_index(args[-1])
         self.set.stop_instrument(index)
 
     @catch_exception    
+    @set_action
     def select_loop(self, action_def, args):
         self.set.select_loop(args)
 
     @catch_exception    
+    @set_action
     def deselect_loop(self, action_def, args):
         self.set.deselect_loop(args)
 
     @catch_exception    
+    @set_action
     def stop_loop(self, action_def, args):
         self.set.stop_loop(args)
         
     @catch_exception    
+    @set_action
     def clear_loop(self, action_def, args):
         self.set.clear_loop(args)
 
     @catch_exception    
+    @set_action
     def quantize_loop(self, action_def, args):
         self.set.quantize_loop(args)
 
     @catch_exception    
+    @set_action
     def mute_all_loops(self, action_def, args):
         self.set.mute_all_loops()
 
     @catch_exception    
+    @set_action
     def unmute_all_loops(self, action_def, args):
         self.set.unmute_all_loops()
 
     @catch_exception    
+    @set_action
     def stop_all_loops(self, action_def, args):
         self.set.stop_all_loops()
 
     @catch_exception    
+    @set_action
     def select_snap(self, action_def, args):
-        index = int(args[-1]) - 1
+        index = parse_index(args[-1])
         self.set.select_snap(index)
 
     @catch_exception    
+    @set_action
     def deselect_snap(self, action_def, args):
-        index = int(args[-1]) - 1
+        index = parse_index(args[-1])
         self.set.deselect_snap(index)
 
     @catch_exception    
+    @set_action
     def assign_snap(self, action_def, args):
-        index = int(args[-1]) - 1
+        index = parse_index(args[-1])
         self.set.assign_snap(index)
 
     @catch_exception    
+    @set_action
     def clear_snap(self, action_def, args):
-        index = int(args[-1]) - 1
+        index = parse_index(args[-1])
         self.set.clear_snap(index)
 
     @catch_exception    
+    @set_action
     def recall_snap(self, action_def, args):
-        self.log('ramp')
-        self.log(args)
-        beats = 0
-        if args:
-            beats = int(args)*4
-        self.set.recall_snap(beats)
+        logger.log(DEBUG, 'recall_snap %s', args)
+        self.set.recall_snap(*parse_ramp_args(args))
 
     @catch_exception
+    @set_action
     def select_global_instrument(self, action_def, args):
-        index = int(args[-1]) - 1
+        index = parse_index(args[-1])
         self.set.select_global_instrument(index)
 
     @catch_exception
+    @set_action
     def deselect_global_instrument(self, action_def, args):
-        index = int(args[-1]) - 1
+        index = parse_index(args[-1])
         self.set.deselect_global_instrument(index)
 
     @catch_exception    
+    @set_action
     def select_global_loop(self, action_def, args):
         self.set.select_global_loop()
 
     @catch_exception    
+    @set_action
     def stop_global_loop(self, action_def, args):
         self.set.stop_global_loop()
 
     @catch_exception    
+    @set_action
     def clear_global_loop(self, action_def, args):
         self.set.clear_global_loop()
 
     @catch_exception    
+    @set_action
     def toggle_metronome(self, action_def, args):
         self.set.toggle_metronome()
 
+    #Runs actions sent over the socket as one batch, returning True or an error message per action
+    @timed('socket.actions')
+    def run_actions(self, actions):
+        results = []
+        if not self.set:
+            return ['no active set' for action in actions]
+        with self.set.batch():
+            for action in actions:
+                start = timer()
+                method = None
+                try:
+                    if not isinstance(action, dict) or 'name' not in action:
+                        raise ValueError('Action must be an object with a name, got %r' % (action,))
+                    if action.get('name') not in SOCKET_ACTIONS:
+                        raise KeyError(action.get('name'))
+                    method = action['name']
+                    arg_type = SOCKET_ACTIONS[method]
+                    args = action.get('args')
+                    if arg_type == 'index':
+                        getattr(self.set, method)(parse_index(args))
+                    elif arg_type == 'name':
+                        getattr(self.set, method)(str(args).upper())
+                    elif arg_type == 'key':
+                        getattr(self.set, method)(str(args))
+                    elif arg_type == 'ramp':
+                        getattr(self.set, method)(*parse_ramp_args(args))
+                    else:
+                        getattr(self.set, method)()
+                    results.append(True)
+                except Exception as e:
+                    logger.log(ERROR, traceback.format_exc())
+                    results.append('%s: %s' % (type(e).__name__, e))
+                #Each action's Live writes are applied before the next action runs, so that it sees them
+                #(a module armed by activate_module before select_loop fires its slots); only the router
+                #updates wait for the end of the batch
+                try:
+                    self.set.writes.flush()
+                except Exception as e:
+                    logger.log(ERROR, traceback.format_exc())
+                #Only known actions are recorded, so clients cannot add histograms
+                if method:
+                    record('action.%s' % method, (timer() - start) * 1000)
+        return results
+
     @catch_exception
+    @timed('get_state')
     def get_state(self):
         return get_state(self.set)
 
-    def log(self, message):
-        self.canonical_parent.log_message(message)
\ No newline at end of file
+    def log(self, message, *args):
+        logger.log(INFO, message, *args)
\ No newline at end of file
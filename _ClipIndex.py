@@ -0,0 +1,51 @@
+from _EbiagiComponent import EbiagiComponent
+from _naming_conventions import *
+from _Framework.SubjectSlot import subject_slot, subject_slot_group
+
+#Maps clip {name}s on a track to every clip slot with that name, in track order, kept current through slot and clip name listeners
+class ClipNameIndex(EbiagiComponent):
+
+    def __init__(self, track):
+        super(ClipNameIndex, self).__init__()
+        self._track = track
+        self._slots = {}
+        self._dirty = True
+
+        self._on_clip_slots_changed.subject = track
+        self._observe_slots()
+        self._build()
+
+    def get(self, name):
+        if self._dirty:
+            self._build()
+        return self._slots.get(name, ())
+
+    def _build(self):
+        slots = {}
+        for clip_slot in self._track.clip_slots:
+            if clip_slot.has_clip:
+                name = parse_clip_name(clip_slot.clip.name)
+                if name is not None:
+                    slots.setdefault(name, []).append(clip_slot)
+        self._slots = dict((name, tuple(matches)) for name, matches in slots.items())
+        self._dirty = False
+
+    def _observe_slots(self):
+        self._on_has_clip_changed.replace_subjects(self._track.clip_slots)
+        self._observe_clips()
+
+    def _observe_clips(self):
+        self._on_clip_name_changed.replace_subjects([s.clip for s in self._track.clip_slots if s.has_clip])
+        self._dirty = True
+
+    @subject_slot('clip_slots')
+    def _on_clip_slots_changed(self):
+        self._observe_slots()
+
+    @subject_slot_group('has_clip')
+    def _on_has_clip_changed(self, clip_slot):
+        self._observe_clips()
+
+    @subject_slot_group('name')
+    def _on_clip_name_changed(self, clip):
+        self._dirty = True
@@ -1,5 +1,6 @@
 from _Framework.ControlSurfaceComponent import ControlSurfaceComponent
 from ClyphX_Pro.clyphx_pro.ClyphXComponentBase import ClyphXComponentBase
+from _Log import logger, DEBUG, INFO, WARNING, ERROR
 
 class EbiagiComponent(ClyphXComponentBase):
 
@@ -7,8 +8,18 @@ class EbiagiComponent(ClyphXComponentBase):
         super(EbiagiComponent, self).__init__(*a, **k)
         self._song = self.canonical_parent.song()
 
-    def log(self, message):
-        self.canonical_parent.log_message(message)
+    #Messages with args are only formatted when their level is enabled
+    def log(self, message, *args):
+        logger.log(INFO, message, *args)
+
+    def debug(self, message, *args):
+        logger.log(DEBUG, message, *args)
+
+    def warn(self, message, *args):
+        logger.log(WARNING, message, *args)
+
+    def error(self, message, *args):
+        logger.log(ERROR, message, *args)
 
     def message(self, message):
         self.canonical_parent.show_message(message)
@@ -1,96 +1,187 @@
+SECTIONS = ('inputs', 'modules', 'instr', 'loops', 'snaps', 'ginstr', 'globalLoop', 'metronome')
+
 def get_state(Set):
     if Set and not Set.loading:
+        return Set.state_cache.get_state()
+    else:
+        return 'no active set'
 
-        modules = []
-        loops = []
-        clips = []
-        instr = []
-        inputs = {}
-        mfx = []
-        ginstr = []
-        globalLoop = None
-        snaps = []
-        metronome = Set._song.metronome > 0
-
-        for ipt in Set.inputs.values():       
-            if len(ipt._instruments) > 1:
-                inputs[ipt.short_name] = 'white'
-            elif len(ipt._instruments) == 1:
-                inputs[ipt.short_name] = color_name(next(iter(ipt._instruments))._track.color_index)
-            elif ipt.phantom_instrument:
-                inputs[ipt.short_name] = color_name(ipt.phantom_instrument._track.color_index)
-            else:
-                inputs[ipt.short_name] = 'dark'
-            if ipt._track.mute == 1:
-                inputs[ipt.short_name] = 'dark'
-
-        for module in Set.modules:
-            color = color_name(module._track.color_index)
-            brightness = 1 if module is Set.active_module else 0
-            modules.append({
-                'index': Set.modules.index(module),
-                'color': color, 
-                'brightness': brightness,
-            })
+#Keeps every rendered section of get_state until an action or Live listener marks it dirty
+class StateCache(object):
 
-        for instrument in Set.active_module.instruments:
-            color = color_name(instrument._track.color_index)
-            brightness = 1 if instrument.is_armed() else 0
-            instr.append({
-                'index': Set.active_module.instruments.index(instrument),
-                'color': color, 
-                'brightness': brightness,
-            })
+    def __init__(self, Set):
+        self._set = Set
+        self._sections = {
+            'clips': [],
+            'mfx': [],
+        }
+        self._loops = {}
+        self._dirty = set(SECTIONS)
+        self._state = None
+
+    def invalidate(self, sections=()):
+        sections = sections or SECTIONS
+        if 'loops' in sections:
+            self._loops = {}
+        self._dirty.update(sections)
+
+    def invalidate_loop(self, key):
+        self._loops.pop(key, None)
+        self._dirty.add('loops')
+
+    def get_state(self):
+        if self._dirty:
+            for section in self._dirty:
+                self._sections[section] = RENDERERS[section](self._set, self)
+            self._dirty = set([])
+            self._state = dict(self._sections)
+        return self._state
 
-        for key in Set.active_module.loops:
-            loop = Set.active_module.loops[key]
-            color = 'red' if loop.can_record() and not loop.has_clips() or loop.is_recording() else color_name(loop.color())
-            brightness = 1 if loop.is_playing() else 0
-            loops.append({
+    def render_loop(self, key, loop):
+        entry = self._loops.get(key)
+        if entry is None:
+            status = loop.status()
+            color = 'red' if status.recordable and not status.clip_count or status.recording else color_name(status.color)
+            brightness = 1 if status.playing else 0
+            entry = {
                 'key_name': key,
                 'color': color, 
                 'brightness': brightness,
-            })   
+            }
+            self._loops[key] = entry
+        return entry
 
 
-        for snap in Set.active_module.snaps:
-            color = 'blue' if snap is Set.snap_control.selected_snap else 'white'
-            brightness = 1 if len(snap.snap_params) > 0 else 0
-            snaps.append({
-                'index': Set.active_module.snaps.index(snap),
-                'color': color, 
-                'brightness': brightness,
-            })
-
-        for global_instrument in Set.global_instruments:
-            brightness = 1 if global_instrument.is_armed() else 0
-            ginstr.append({
-                'index': Set.global_instruments.index(global_instrument),
-                'color': 'white', 
-                'brightness': brightness, 
-            })
-
-        global_loop = {
-            'color': 'red' if Set.global_loop.is_recording else 'white', 
-            'brightness': 1 if Set.global_loop.is_playing else 0,
-        }
+def render_inputs(Set, cache):
+    inputs = {}
+    for ipt in Set.inputs.values():       
+        if len(ipt._instruments) > 1:
+            inputs[ipt.short_name] = 'white'
+        elif len(ipt._instruments) == 1:
+            inputs[ipt.short_name] = color_name(next(iter(ipt._instruments))._track.color_index)
+        elif ipt.phantom_instrument:
+            inputs[ipt.short_name] = color_name(ipt.phantom_instrument._track.color_index)
+        else:
+            inputs[ipt.short_name] = 'dark'
+        if ipt._track.mute == 1:
+            inputs[ipt.short_name] = 'dark'
+    return inputs
 
+def render_modules(Set, cache):
+    modules = []
+    for index, module in enumerate(Set.modules):
+        color = color_name(module._track.color_index)
+        brightness = 1 if module is Set.active_module else 0
+        modules.append({
+            'index': index,
+            'color': color, 
+            'brightness': brightness,
+        })
+    return modules
 
-        return {
-            'instr': instr,
-            'inputs': inputs,
-            'modules': modules,
-            'loops': loops,
-            'clips': clips,
-            'mfx': mfx,
-            'ginstr': ginstr,
-            'globalLoop': global_loop,
-            'snaps': snaps,
-            'metronome': metronome
-        }
+def render_instr(Set, cache):
+    instr = []
+    for index, instrument in enumerate(Set.active_module.instruments):
+        color = color_name(instrument._track.color_index)
+        brightness = 1 if instrument.is_armed() else 0
+        instr.append({
+            'index': index,
+            'color': color, 
+            'brightness': brightness,
+        })
+    return instr
 
-    else:
-        return 'no active set'
+def render_loops(Set, cache):
+    loops = []
+    for key, loop in Set.active_module.loops.items():
+        loops.append(cache.render_loop(key, loop))
+    return loops
+
+def render_snaps(Set, cache):
+    snaps = []
+    for index, snap in enumerate(Set.active_module.snaps):
+        color = 'blue' if snap is Set.snap_control.selected_snap else 'white'
+        brightness = 1 if snap.has_params() else 0
+        snaps.append({
+            'index': index,
+            'color': color, 
+            'brightness': brightness,
+        })
+    return snaps
+
+def render_ginstr(Set, cache):
+    ginstr = []
+    for index, global_instrument in enumerate(Set.global_instruments):
+        brightness = 1 if global_instrument.is_armed() else 0
+        ginstr.append({
+            'index': index,
+            'color': 'white', 
+            'brightness': brightness, 
+        })
+    return ginstr
+
+def render_global_loop(Set, cache):
+    return {
+        'color': 'red' if Set.global_loop.is_recording else 'white', 
+        'brightness': 1 if Set.global_loop.is_playing else 0,
+    }
+
+def render_metronome(Set, cache):
+    return Set._song.metronome > 0
+
+RENDERERS = {
+    'inputs': render_inputs,
+    'modules': render_modules,
+    'instr': render_instr,
+    'loops': render_loops,
+    'snaps': render_snaps,
+    'ginstr': render_ginstr,
+    'globalLoop': render_global_loop,
+    'metronome': render_metronome,
+}
+
+#Sections of get_state whose entries are sent as individual keys in state deltas
+KEYED_SECTIONS = {
+    'instr': 'index',
+    'modules': 'index',
+    'loops': 'key_name',
+    'snaps': 'index',
+    'ginstr': 'index',
+}
+
+#Splits list sections into dicts keyed per entry so that they can be compared entry by entry
+def key_state(state):
+    keyed = {}
+    for section, value in state.items():
+        if section in KEYED_SECTIONS:
+            key = KEYED_SECTIONS[section]
+            keyed[section] = dict((entry[key], entry) for entry in value)
+        else:
+            keyed[section] = value
+    return keyed
+
+#Sections whose entries are diffed one by one; any other section that changed is sent whole
+DIFFED_SECTIONS = frozenset(list(KEYED_SECTIONS) + ['inputs'])
+
+#Changed entries of keyed state new compared to old, with None for removed entries
+def diff_state(old, new, sections=None):
+    changes = {}
+    for section in sections or new.keys():
+        old_value = old.get(section)
+        new_value = new.get(section)
+        if section in DIFFED_SECTIONS and isinstance(new_value, dict) and isinstance(old_value, dict):
+            section_changes = {}
+            for key, entry in new_value.items():
+                if old_value.get(key) != entry:
+                    section_changes[key] = entry
+            for key in old_value:
+                if key not in new_value:
+                    section_changes[key] = None
+            if section_changes:
+                changes[section] = section_changes
+        elif old_value != new_value:
+            changes[section] = new_value
+    return changes
 
 def color_name(index):
     color_index_map = {
@@ -1,5 +1,6 @@
 from _EbiagiComponent import EbiagiComponent
 from _naming_conventions import *
+from _Framework.SubjectSlot import subject_slot
 
 class Input(EbiagiComponent):
 
@@ -12,11 +13,17 @@ class Input(EbiagiComponent):
         self.has_audio_input = track.has_audio_input
         self.has_midi_input = track.has_midi_input
 
-        self.short_name = get_short_name(track.name)
+        self.short_name = describe(track.name).short_name
 
         self.phantom_instrument = None
 
-        self.log('Initializing Input %s...' % self.short_name)
+        self.debug('Initializing Input %s...', self.short_name)
+
+        self._on_mute_changed.subject = track
+
+    @subject_slot('mute')
+    def _on_mute_changed(self):
+        self._set.state_changed('inputs')
 
     def add_instrument(self, instrument):
         self._instruments.add(instrument)
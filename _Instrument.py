@@ -1,7 +1,8 @@
 from functools import partial
 from _EbiagiComponent import EbiagiComponent
 from _naming_conventions import *
-from _utils import set_input_routing, set_output_routing
+from _utils import set_input_routing, set_output_routing, live_key
+from _Framework.SubjectSlot import subject_slot
 
 class Instrument(EbiagiComponent):
 
@@ -10,57 +11,75 @@ class Instrument(EbiagiComponent):
         self._track = track
         self._set = Set
 
-        self._midi_inputs = []
-        self._audio_inputs = []
-        self._ex_midi = []
-        self._ex_audio = []
-
-
         self._midi_router = None
         self._audio_router = None
 
-        self.short_name = get_short_name(track.name.split('.')[0])
+        self._param_indices = None
+
+        info = describe(track.name)
+        self.short_name = info.short_name
+
+        self.debug('Initializing Instrument %s...', self.short_name)
 
-        self.log('Initializing Instrument %s...' % self.short_name)
+        inputs = [Set.inputs[name] for name in info.inputs if Set.inputs[name]]
+        self._midi_inputs = tuple(ipt for ipt in inputs if ipt.has_midi_input)
+        self._audio_inputs = tuple(ipt for ipt in inputs if ipt.has_audio_input)
+        self._inputs = self._midi_inputs + self._audio_inputs
 
-        input_names = get_short_name(track.name.split('.')[1]).split(',')
-        for name in input_names:
-            if Set.inputs[name]:
-                if Set.inputs[name].has_midi_input:
-                    self._midi_inputs.append(Set.inputs[name])
-                if Set.inputs[name].has_audio_input:
-                    self._audio_inputs.append(Set.inputs[name])
-        
+        self.signature = Instrument.get_signature(track, Set.topology)
 
-        i = list(self._song.tracks).index(track) + 1
-        while is_ex_instrument_track(self._song.tracks[i].name):
+        self._on_devices_changed.subject = track
 
-            #Add Ex Tracks
-            if is_ex_instrument_track(self._song.tracks[i].name):
-                if self._song.tracks[i].has_midi_input:
-                    self._ex_midi.append(self._song.tracks[i])
-                elif self._song.tracks[i].has_audio_input:
-                    self._ex_audio.append(self._song.tracks[i])
+        #Add Ex Tracks; the track layout only changes through a refresh, which rebuilds changed instruments
+        ex_tracks = Set.topology.ex_tracks(track)
+        self._ex_midi = tuple(t for t in ex_tracks if t.has_midi_input)
+        self._ex_audio = tuple(t for t in ex_tracks if not t.has_midi_input and t.has_audio_input)
+        self._tracks = (track,) + self._ex_midi + self._ex_audio
+        self._track_keys = frozenset(live_key(t) for t in self._tracks)
 
-            i += 1
+    @staticmethod
+    def get_signature(track, topology):
+        return (live_key(track), track.name) + tuple((live_key(t), t.name) for t in topology.ex_tracks(track))
 
     def activate(self):
+        self._set.writes.write_all(self.activation_writes())
+        self.claim_routers()
+
+    #(object, property, value) writes that turn the instrument on, used by module switch plans
+    def activation_writes(self):
+        writes = []
+        if len(self._track.devices) > 0:
+            writes.append((self._track.devices[0].parameters[0], 'value', 1))
+            for track in self._tracks:
+                writes.extend(self._monitoring_writes(track))
+        return writes
+
+    def deactivation_writes(self):
+        writes = []
         if len(self._track.devices) > 0:
-            self._track.devices[0].parameters[0].value = 1
-            for track in [self._track] + self._ex_midi + self._ex_audio:
-                self.log(track.name)
-                self.set_default_monitoring_state(track)
+            writes.append((self._track.devices[0].parameters[0], 'value', 0))
+            for track in self._tracks:
+                if track.can_be_armed:
+                    writes.append((track, 'arm', 0))
+        return writes
+
+    def routers(self):
+        return [router for router in (self._midi_router, self._audio_router) if router]
+
+    def claim_routers(self):
         if self._midi_router:
             self._midi_router.set_instrument(self)
         if self._audio_router:
             self._audio_router.set_instrument(self)
 
     def deactivate(self):
-        if len(self._track.devices) > 0:
-            self._track.devices[0].parameters[0].value = 0
-            for track in [self._track] + self._ex_midi + self._ex_audio:
-                if track.can_be_armed:
-                    track.arm = 0 
+        self._set.writes.write_all(self.deactivation_writes())
+
+    #Switch plans write to the first device, so they are dropped when devices change
+    @subject_slot('devices')
+    def _on_devices_changed(self):
+        self._param_indices = None
+        self._set.invalidate_switch_plans()
 
     def select(self):
         self._song.view.selected_track = self._track
@@ -69,6 +88,10 @@ class Instrument(EbiagiComponent):
     def deselect(self):
         self._unassign_from_inputs()
 
+    #Inputs the instrument is assigned to on select
+    def inputs(self):
+        return self._inputs
+
     def _assign_to_inputs(self):
         for midi_input in self._midi_inputs:
             midi_input.add_instrument(self)
@@ -107,11 +130,21 @@ class Instrument(EbiagiComponent):
         else:
             set_input_routing(track, router._track.name)
 
+    #Index of param on the instrument's first device, or None; the map is built on first use
+    def parameter_index(self, param):
+        if len(self._track.devices) == 0:
+            return None
+        key = live_key(param)
+        if self._param_indices is None or key not in self._param_indices:
+            parameters = self._track.devices[0].parameters
+            self._param_indices = dict((live_key(p), i) for i, p in enumerate(parameters))
+        return self._param_indices.get(key)
+
     def is_armed(self):
         return False
 
     def has_track(self, track):
-        return track in [self._track] + self._ex_midi + self._ex_audio
+        return live_key(track) in self._track_keys
 
     def has_midi_input(self):
         return len(self._midi_inputs) > 0
@@ -129,25 +162,27 @@ class Instrument(EbiagiComponent):
         return False
 
     def stop(self):
-        for track in [self._track] + self._ex_midi + self._ex_audio:
+        for track in self._tracks:
             track.stop_all_clips()     
 
     def mute_loops(self):
-        for track in [self._track] + self._ex_midi + self._ex_audio:
+        for track in self._tracks:
             if not is_source_track(track.name):
-                track.current_monitoring_state = 0
-                track.arm = 0
+                self._set.writes.write(track, 'current_monitoring_state', 0)
+                self._set.writes.write(track, 'arm', 0)
 
     def unmute_loops(self):
-        for track in [self._track] + self._ex_midi + self._ex_audio:
+        for track in self._tracks:
             self.set_default_monitoring_state(track)
 
     def set_default_monitoring_state(self, track):
+        self._set.writes.write_all(self._monitoring_writes(track))
+
+    @staticmethod
+    def _monitoring_writes(track):
         if is_source_track(track.name):
-            track.current_monitoring_state = 2
+            return [(track, 'current_monitoring_state', 2)]
         elif is_compiled_track(track.name):
-            track.current_monitoring_state = 2
-            track.arm = 1
+            return [(track, 'current_monitoring_state', 2), (track, 'arm', 1)]
         else:
-            track.current_monitoring_state = 1
-            track.arm = 1
\ No newline at end of file
+            return [(track, 'current_monitoring_state', 1), (track, 'arm', 1)]
\ No newline at end of file
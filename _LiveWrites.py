@@ -0,0 +1,59 @@
+from collections import OrderedDict
+from _utils import live_key
+
+#Shared layer for Live property writes (arm, monitoring, mute, fold state, parameter values).
+#Writes that would not change a value are dropped. While the Set is in a batch, writes are held,
+#later writes to the same property replace earlier ones, and each is applied once at the end.
+class LiveWrites(object):
+
+    def __init__(self, Set):
+        self._set = Set
+        self._pending = OrderedDict()
+        self.buffering = False
+
+        self.written = 0
+        self.saved = 0
+
+    def write(self, obj, name, value):
+        if self.buffering:
+            key = (live_key(obj), name)
+            if key in self._pending:
+                self.saved += 1
+            self._pending[key] = (obj, name, value)
+        else:
+            self._apply(obj, name, value)
+
+    def write_all(self, writes):
+        for obj, name, value in writes:
+            self.write(obj, name, value)
+
+    #Value of a property as it will be once pending writes are applied
+    def value(self, obj, name):
+        pending = self._pending.get((live_key(obj), name))
+        if pending:
+            return pending[2]
+        return getattr(obj, name)
+
+    def flush(self):
+        pending = self._pending
+        self._pending = OrderedDict()
+        for obj, name, value in pending.values():
+            try:
+                self._apply(obj, name, value)
+            except Exception, e:
+                self._set.error('Write of %s failed: %s', name, e)
+
+    #Writes applied to Live, and writes dropped because they were replaced or would not change a value
+    def counts(self):
+        return {'written': self.written, 'saved': self.saved}
+
+    def reset_counts(self):
+        self.written = 0
+        self.saved = 0
+
+    def _apply(self, obj, name, value):
+        if getattr(obj, name) == value:
+            self.saved += 1
+        else:
+            setattr(obj, name, value)
+            self.written += 1
@@ -0,0 +1,70 @@
+import os
+from collections import deque
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'error': ERROR}
+LEVEL_NAMES = dict((level, name.upper()) for name, level in LEVELS.items())
+
+#Overridable from the environment Live is started from. Without a log file, lines go to Live's Log.txt
+LOG_LEVEL = LEVELS.get(os.environ.get('EBIAGI_LOG_LEVEL', 'info').lower(), INFO)
+LOG_FILE = os.environ.get('EBIAGI_LOG_FILE')
+
+#Lines kept between flushes; older ones are dropped first
+BUFFER_SIZE = 1000
+
+#Leveled logger writing through a ring buffer, which is flushed in one write on idle ticks.
+#Lines below the level return before any formatting; errors are flushed at once.
+class Logger(object):
+
+    def __init__(self, level=LOG_LEVEL, path=LOG_FILE, size=BUFFER_SIZE):
+        self.level = level
+        self.path = path
+        self._sink = None
+        self._buffer = deque(maxlen=size)
+        self._dropped = 0
+
+    #Where lines go when there is no log file, usually the control surface's log_message
+    def set_sink(self, sink):
+        self._sink = sink
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def log(self, level, message, *args):
+        if level < self.level:
+            return
+        if args:
+            message = message % args
+        if len(self._buffer) == self._buffer.maxlen:
+            self._dropped += 1
+        self._buffer.append('%s %s' % (LEVEL_NAMES[level], message))
+        if level >= ERROR:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer or not (self.path or self._sink):
+            return
+        lines = list(self._buffer)
+        self._buffer.clear()
+        if self._dropped:
+            lines.insert(0, 'WARNING %d log lines dropped' % self._dropped)
+            self._dropped = 0
+        text = '\n'.join(lines)
+        if self.path:
+            if not isinstance(text, str):
+                text = text.encode('utf-8')
+            with open(self.path, 'a') as f:
+                f.write(text + '\n')
+        else:
+            self._sink(text)
+
+    def clear_file(self):
+        if self.path:
+            open(self.path, 'w').close()
+
+
+logger = Logger()
@@ -1,33 +1,49 @@
-from _EbiagiComponent import EbiagiComponent
+from collections import namedtuple
 from _naming_conventions import *
 from _utils import is_empty_midi_clip
+from _Snap import SNAP_COUNT
+from _Log import logger, DEBUG, WARNING
 
-class Loop(EbiagiComponent):
+#What get_state shows of a loop, read from Live once and kept until a listener reports a change
+LoopStatus = namedtuple('LoopStatus', ['clip_count', 'recordable', 'recording', 'playing', 'color'])
 
-    def __init__(self, track, scene, Set, instruments):
-        super(Loop, self).__init__()
+#Loops and clip slots are plain slotted objects: a big set has tens of thousands of them,
+#and their listeners live on the Module
+class Loop(object):
+
+    __slots__ = ('_track', '_scene', '_set', '_main_clip_slot', '_clip_slots', 'short_name', 'signature', '_status')
+
+    def __init__(self, track, scene, Set, track_instruments):
         self._track = track
         self._scene = scene
         self._set = Set
 
-        s = list(self._song.scenes).index(scene)
+        s = Set.scene_index.position(scene)
         self._main_clip_slot = track.clip_slots[s]
-        self._clip_slots = []
+        self.signature = None
+        self._status = None
+
+        self.short_name = describe(scene.name).short_name
+
+        logger.log(DEBUG, 'Initializing Loop %s %s...', describe(track.name).short_name, self.short_name)
 
-        self.short_name = get_short_name(scene.name)
+        self._clip_slots = tuple(ClipSlot(member.clip_slots[s], member, instr, Set, s) for member, instr in track_instruments)
 
-        self.log('Initializing Loop %s %s...' % (get_short_name(track.name), self.short_name))
+    #Kept current by the Module's clip slot and arm listeners, which call invalidate_status
+    def status(self):
+        if self._status is None:
+            clip_count = sum(1 for clip_slot in self._clip_slots if clip_slot.has_clip())
+            self._status = LoopStatus(
+                clip_count,
+                self.can_record(),
+                self.is_recording(),
+                self.is_playing(),
+                (self._main_clip_slot.color_index or 55) if clip_count else 'none',
+            )
+        return self._status
 
-        i = list(self._song.tracks).index(track) + 1
-        while not is_module(self._song.tracks[i].name) and self._song.tracks[i].is_grouped:
-            instr = None
-            for instrument in instruments:
-                if instrument.has_track(self._song.tracks[i]):
-                    instr = instrument
-            if instr:
-                clip_slot = ClipSlot(self._song.tracks[i].clip_slots[s], self._song.tracks[i], instr, Set)
-                self._clip_slots.append(clip_slot)
-            i += 1
+    def invalidate_status(self):
+        self._status = None
 
     def select(self):
         if self.is_recording():
@@ -106,22 +122,38 @@ class Loop(EbiagiComponent):
 
 
 #Wrapper for clip_slot to add its track
-class ClipSlot(EbiagiComponent):
+class ClipSlot(object):
 
-    def __init__(self, slot, track, instrument=None, Set=None):
-        super(ClipSlot, self).__init__()
+    __slots__ = ('_slot', '_track', '_instrument', '_set', '_index', '_held', 'name', '_clip_commands')
+
+    def __init__(self, slot, track, instrument=None, Set=None, index=None):
         self._slot = slot
         self._track = track
         self._instrument = instrument
         self._set = Set
+        self._index = index
         self._held = False
+        self.name = None
+        self._clip_commands = ()
+        self.compile_commands()
+
+    #Clip names are compiled once, and again when the clip is renamed, recorded or deleted
+    def compile_commands(self):
         if self._slot.has_clip:
-            self.name = parse_clip_name(self._slot.clip.name)
-            self._clip_commands = parse_clip_commands(self._slot.clip.name) or []
+            clip_name = self._slot.clip.name
+            self.name = parse_clip_name(clip_name)
+            self._clip_commands, errors = compile_clip_commands(clip_name, SNAP_COUNT)
+            for error in errors:
+                logger.log(WARNING, 'Clip "%s" on %s: %s', clip_name, self._track.name, error)
+            if any(command.name == 'PLAY' for command in self._clip_commands):
+                self._set.clip_index(self._track)
+        else:
+            self.name = None
+            self._clip_commands = ()
 
     #(because clip_slot.will_record_on_start does not work)
     def will_record_on_start(self):
-        return not self._slot.has_clip and self._slot.has_stop_button and self._track.can_be_armed and self._track.arm
+        return not self._slot.has_clip and self._slot.has_stop_button and self._track.can_be_armed and self._set.writes.value(self._track, 'arm')
 
     def fire(self):
         if self.will_record_on_start() and not self._instrument.is_selected():
@@ -176,43 +208,54 @@ class ClipSlot(EbiagiComponent):
             self._held = True
 
             for command in self._clip_commands:
+                handler = self.SELECT_COMMANDS.get(command.name)
+                if handler:
+                    handler(self, command.arg)
 
-                if 'SELECT' in command:
-                    self._set.select_instrument(None, self._instrument)
-                    self._set.deselect_instrument(None, self._instrument)
-
-                if 'SNAP' in command:
-                    index = int(parse_clip_command_param(command))
-                    self.log(index)
-                    self._set.snap_control.select_snap(self._set.active_module.snaps[index])
-                    self._set.snap_control.ramp(0)
-
-                if 'PLAY' in command:
-                    clip_name_to_play = parse_clip_command_param(command)
-                    self.log(clip_name_to_play)
-                    for clip_slot in self._track.clip_slots:
-                        if clip_slot.has_clip:
-                            self.log(parse_clip_name(clip_slot.clip.name))
-                            if parse_clip_name(clip_slot.clip.name) == clip_name_to_play:
-                                clip_slot.fire()
-
-                if 'STOP' in command:
-                    self._track.stop_all_clips()
-
-    
     def run_deselect_commands(self):
         if self._slot.has_clip:
 
             for command in self._clip_commands:
-
-                if 'HOLD' in command and self._held:
-                    can_stop = True
-                    for clip_slot in self._track.clip_slots:
-                        if (clip_slot.is_playing or clip_slot.is_triggered) and clip_slot.clip != self._slot.clip:
-                            can_stop = False
-                    if can_stop:
-                        list(self._track.clip_slots)[self._set.get_scene_index('STOPCLIP')].fire()
+                handler = self.DESELECT_COMMANDS.get(command.name)
+                if handler:
+                    handler(self, command.arg)
 
             self._held = False
 
-
+    def _select(self, arg):
+        self._set.select_instrument(None, self._instrument)
+        self._set.deselect_instrument(None, self._instrument)
+
+    def _snap(self, index):
+        self._set.snap_control.select_snap(self._set.active_module.snaps[index])
+        self._set.snap_control.ramp(0)
+
+    def _play(self, clip_name_to_play):
+        #Every slot with the name is fired, as before the index
+        for clip_slot in self._set.clip_index(self._track).get(clip_name_to_play):
+            clip_slot.fire()
+
+    def _stop(self, arg):
+        self._track.stop_all_clips()
+
+    def _hold(self, arg):
+        if self._held:
+            #Only stop when no other clip on the track is playing or triggered
+            playing = self._track.playing_slot_index
+            fired = self._track.fired_slot_index
+            #fired_slot_index is -2 while the track's stop button is fired, which is not nothing fired
+            can_stop = (playing < 0 or playing == self._index) and (fired == -1 or fired == self._index)
+            stop_index = self._set.get_scene_index('STOPCLIP')
+            if can_stop and stop_index is not None:
+                self._track.clip_slots[stop_index].fire()
+
+    SELECT_COMMANDS = {
+        'SELECT': _select,
+        'SNAP': _snap,
+        'PLAY': _play,
+        'STOP': _stop,
+    }
+
+    DESELECT_COMMANDS = {
+        'HOLD': _hold,
+    }
@@ -0,0 +1,80 @@
+import sys
+import time
+import functools
+from bisect import bisect_left
+
+#time.clock is the precise wall clock on Windows in Python 2
+timer = time.clock if sys.platform == 'win32' else time.time
+
+#Histogram bucket upper bounds in ms, 20% apart from 10 us up to about a minute
+BOUNDS = []
+_bound = 0.01
+while _bound < 60000:
+    BOUNDS.append(_bound)
+    _bound *= 1.2
+BOUNDS.append(float('inf'))
+
+class Histogram(object):
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * len(BOUNDS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, ms):
+        self.counts[bisect_left(BOUNDS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    #Upper bound of the bucket holding the pth percentile, so at most 20% high
+    def percentile(self, p):
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return min(BOUNDS[i], self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 3) if self.count else 0,
+            'p50': round(self.percentile(50), 3),
+            'p95': round(self.percentile(95), 3),
+            'p99': round(self.percentile(99), 3),
+            'max': round(self.max, 3),
+        }
+
+
+_histograms = {}
+
+def record(name, ms):
+    histogram = _histograms.get(name)
+    if histogram is None:
+        histogram = _histograms[name] = Histogram()
+    histogram.record(ms)
+
+#Records the wall-clock latency of every call, in ms, under name, including calls that raise
+def timed(name):
+    def decorator(f):
+        @functools.wraps(f)
+        def func(*args, **kwargs):
+            start = timer()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                record(name, (timer() - start) * 1000)
+        return func
+    return decorator
+
+def get_metrics():
+    return dict((name, histogram.summary()) for name, histogram in _histograms.items())
+
+def reset_metrics():
+    _histograms.clear()
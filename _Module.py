@@ -2,7 +2,12 @@ from _EbiagiComponent import EbiagiComponent
 from _naming_conventions import *
 from _Instrument import Instrument
 from _Loop import Loop
-from _Snap import Snap
+from _Snap import Snap, encode_snaps, decode_snaps
+from _utils import live_key
+from _Framework.SubjectSlot import subject_slot_group
+
+#Ticks without snap edits before they are saved to the module track
+SNAP_SAVE_TICKS = 5
 
 class Module(EbiagiComponent):
 
@@ -10,76 +15,299 @@ class Module(EbiagiComponent):
         super(Module, self).__init__()
         self._track = track
         self._set = Set
+        self._m = m
+        self._a = a
         self.instruments = []
         self.loops = {}
+        self._active = False
+        self._loops_observed = False
 
-        self.short_name = get_short_name(track.name.split('.')[0])
+        self.short_name = describe(track.name).short_name
 
-        self._snap_data = self._track.get_data('snaps', False) or [[],[],[],[],[],[]]
+        self._snap_data = decode_snaps(self._track.get_data('snaps', False))
         self.snaps = []
+        self._save_ticks = None
+
+        self.debug('Initializing Module %s...', self.short_name)
+
+        self._build_instruments()
+        self._build_loops()
+        self._load_snaps()
+
+    @staticmethod
+    def get_signature(track, topology):
+        return (track.name,) + tuple((live_key(t), t.name) for t in topology.module_tracks(track))
+
+    #Re-reads the module's tracks after a change, keeping instruments whose tracks are unchanged
+    def refresh(self):
+        self.short_name = describe(self._track.name).short_name
+        self.debug('Refreshing Module %s...', self.short_name)
+        added, removed = self._build_instruments()
+        self._build_loops()
+        if removed:
+            self._load_snaps()
+        return added, removed
 
-        self.log('Initializing Module %s...' % self.short_name)
+    #Patches loops after scenes were added, removed, moved or renamed
+    def refresh_loops(self):
+        self._build_loops(self.loops)
 
-        i = list(self._song.tracks).index(track) + 1
-        while not is_module(self._song.tracks[i].name) and self._song.tracks[i].is_grouped:
+    def _build_instruments(self):
+        Set = self._set
+        topology = Set.topology
+        existing = dict((instr.signature, instr) for instr in self.instruments)
+        members = topology.module_tracks(self._track)
+        self.signature = Module.get_signature(self._track, topology)
+
+        m = self._m
+        a = self._a
+        instruments = []
+        added = []
+        for member in members:
 
             #Add Instruments
-            if is_instrument(self._song.tracks[i].name):
-                instr = Instrument(self._song.tracks[i], Set)
+            if describe(member.name).kind == INSTRUMENT:
+                instr = existing.pop(Instrument.get_signature(member, topology), None)
+                if not instr:
+                    instr = Instrument(member, Set)
+                    added.append(instr)
                 if instr.has_midi_input():
-                    instr.set_midi_router(Set.midi_routers[m])
+                    if instr._midi_router is not Set.midi_routers[m]:
+                        instr.set_midi_router(Set.midi_routers[m])
                     m += 1
                 if instr.has_audio_input():
-                    instr.set_audio_router(Set.audio_routers[a])
+                    if instr._audio_router is not Set.audio_routers[a]:
+                        instr.set_audio_router(Set.audio_routers[a])
                     a += 1
-                self.instruments.append(instr)
+                instruments.append(instr)
+                Set.register_instrument(instr)
+        self.instruments = instruments
+        self._instruments_by_name = dict((instr.short_name, instr) for instr in instruments)
+
+        #Member tracks paired with the module instrument that owns them
+        module_instruments = set(self.instruments)
+        self._track_instruments = []
+        for member in members:
+            instr = Set.instrument_for_track(member)
+            if instr in module_instruments:
+                self._track_instruments.append((member, instr))
+
+        removed = list(existing.values())
+        for instr in removed:
+            instr.disconnect()
+        return added, removed
+
+    def _build_loops(self, existing=None):
+        existing = existing or {}
+        loops = {}
+        for s, scene in enumerate(self._set.scene_index.scenes):
+            info = describe(scene.name)
+            if info.kind == LOOP:
+                signature = (live_key(scene), scene.name, s)
+                loop = existing.get(info.short_name)
+                if not loop or loop.signature != signature:
+                    loop = Loop(self._track, scene, self._set, self._track_instruments)
+                    loop.signature = signature
+                loops[loop.short_name] = loop
+        self.loops = loops
+        self._observe_clip_slots()
+        if self._loops_observed:
+            self._observe_loops()
+
+    def _observe_clip_slots(self):
+        clip_slots = []
+        identifiers = []
+        for loop in self.loops.values():
+            clip_slots.append(loop._main_clip_slot)
+            identifiers.append((loop.short_name, None))
+            for clip_slot in loop._clip_slots:
+                clip_slots.append(clip_slot._slot)
+                identifiers.append((loop.short_name, clip_slot))
+        self._on_loop_has_clip_changed.replace_subjects(clip_slots, identifiers)
+        self._observe_clip_names()
+
+    def _observe_clip_names(self):
+        clips = []
+        clip_slots = []
+        for loop in self.loops.values():
+            for clip_slot in loop._clip_slots:
+                if clip_slot.has_clip():
+                    clips.append(clip_slot._slot.clip)
+                    clip_slots.append(clip_slot)
+        self._on_clip_name_changed.replace_subjects(clips, clip_slots)
+
+    #Kept on every module once observed, so that switching modules does not re-register listeners;
+    #only the active module's loops are shown, so the others just keep their loop statuses current
+    def observe_loops(self):
+        if not self._loops_observed:
+            self._loops_observed = True
+            self._observe_loops()
+
+    def _observe_loops(self):
+        loops = list(self.loops.values())
+        keys = [loop.short_name for loop in loops]
+        main_slots = [loop._main_clip_slot for loop in loops]
+        self._on_loop_playing_status_changed.replace_subjects(main_slots, keys)
+        self._on_loop_recording_changed.replace_subjects(main_slots, keys)
+        self._on_loop_color_changed.replace_subjects(main_slots, keys)
+
+        slots = []
+        slot_keys = []
+        for loop in loops:
+            for clip_slot in [loop._main_clip_slot] + [c._slot for c in loop._clip_slots]:
+                slots.append(clip_slot)
+                slot_keys.append(loop.short_name)
+        self._on_loop_stop_button_changed.replace_subjects(slots, slot_keys)
+
+        tracks = [track for track, instr in self._track_instruments if track.can_be_armed]
+        self._on_track_arm_changed.replace_subjects(tracks)
+
+    #Loop statuses are kept current on every observed module; only the active one passes changes on
+    def _loop_changed(self, key):
+        loop = self.loops.get(key)
+        if loop:
+            loop.invalidate_status()
+        if self._active:
+            self._set.loop_changed(key)
+
+    @subject_slot_group('playing_status')
+    def _on_loop_playing_status_changed(self, key):
+        self._loop_changed(key)
+
+    @subject_slot_group('is_recording')
+    def _on_loop_recording_changed(self, key):
+        self._loop_changed(key)
 
-            i += 1
+    @subject_slot_group('color_index')
+    def _on_loop_color_changed(self, key):
+        self._loop_changed(key)
 
-        for scene in self._song.scenes:
-            if is_loop(scene.name):
-                loop = Loop(track, scene, Set, self.instruments)
-                self.loops[loop.short_name] = loop
+    #Observed on every module, as clip commands are recompiled when clips are recorded or deleted
+    @subject_slot_group('has_clip')
+    def _on_loop_has_clip_changed(self, identifier):
+        key, clip_slot = identifier
+        if clip_slot:
+            clip_slot.compile_commands()
+            self._observe_clip_names()
+        self._loop_changed(key)
 
+    @subject_slot_group('name')
+    def _on_clip_name_changed(self, clip_slot):
+        clip_slot.compile_commands()
+
+    @subject_slot_group('has_stop_button')
+    def _on_loop_stop_button_changed(self, key):
+        self._loop_changed(key)
+
+    #Arming a track changes whether any loop will record
+    @subject_slot_group('arm')
+    def _on_track_arm_changed(self, track):
+        for loop in self.loops.values():
+            loop.invalidate_status()
+        if self._active:
+            self._set.state_changed('loops')
+
+    def _load_snaps(self):
+        snap_control = self._set.snap_control
+        selected = None
+        if snap_control and snap_control.selected_snap in self.snaps:
+            selected = self.snaps.index(snap_control.selected_snap)
+
+        self.flush_snaps()
+        self.snaps = []
         for snap in self._snap_data:
-            self.snaps.append(Snap(snap, self, Set))
+            self.snaps.append(Snap(snap, self, self._set))
+
+        if selected is not None:
+            snap_control.select_snap(self.snaps[selected])
+
+    def disconnect(self):
+        self.flush_snaps()
+        for instrument in self.instruments:
+            instrument.disconnect()
+        super(Module, self).disconnect()
 
-                
     def activate(self):
-        self.log('Activating %s...' % self.short_name)
+        self.set_active(True)
+        self._set.writes.write_all(self.activation_writes())
         for instrument in self.instruments:
-            instrument.activate()
-        self._track.fold_state = 0
-        self._track.mute = 0
+            instrument.claim_routers()
 
     def deactivate(self):
-        self.log('Deactivating %s...' % self.short_name)
+        self.set_active(False)
+        self._set.writes.write_all(self.deactivation_writes())
+
+    #Loop events are only passed on while active; the Live writes come from activation_writes and deactivation_writes
+    def set_active(self, active):
+        self.debug('%s %s...', 'Activating' if active else 'Deactivating', self.short_name)
+        self._active = active
+        if active:
+            self.observe_loops()
+
+    def activation_writes(self):
+        writes = []
         for instrument in self.instruments:
-            instrument.deactivate()
-        self._track.fold_state = 1
-        self._track.mute = 1
+            writes.extend(instrument.activation_writes())
+        writes.append((self._track, 'fold_state', 0))
+        writes.append((self._track, 'mute', 0))
+        return writes
 
-    def assign_snap(self, index, param, track):
+    def deactivation_writes(self):
+        writes = []
         for instrument in self.instruments:
-            if instrument._track == track:
-                if not self.snaps[index].has_param(param):
-                    self.snaps[index].create_param(instrument, param)
-                    self.message('Added param %s to snap %s at %s' % (param.name, str(index+1), str(param.value)))
-                else:
-                    self.snaps[index].remove_param(param)
-                    self.message('Removed param %s from snap %s' % (param.name, str(index+1)))
-                self._save_snaps()
+            writes.extend(instrument.deactivation_writes())
+        writes.append((self._track, 'fold_state', 1))
+        writes.append((self._track, 'mute', 1))
+        return writes
+
+    def routers(self):
+        routers = []
+        for instrument in self.instruments:
+            routers.extend(instrument.routers())
+        return routers
+
+    def instrument_by_name(self, short_name):
+        return self._instruments_by_name.get(short_name)
+
+    def assign_snap(self, index, param, track):
+        instrument = self._set.instrument_for_track(track)
+        if instrument in self.instruments and instrument._track == track:
+            param_index = instrument.parameter_index(param)
+            if param_index is None:
+                self.message('Param %s is not on the first device of %s' % (param.name, instrument.short_name))
+                return
+            if not self.snaps[index].has_param(instrument, param_index):
+                self.snaps[index].create_param(instrument, param, param_index)
+                self.message('Added param %s to snap %s at %s' % (param.name, str(index+1), str(param.value)))
+            else:
+                self.snaps[index].remove_param(instrument, param_index)
+                self.message('Removed param %s from snap %s' % (param.name, str(index+1)))
+            self._save_snaps()
 
     def clear_snap(self, index):
         self.snaps[index] = Snap([], self, self._set)
         self._save_snaps()
         self.message('Removed all params from snap %s' % str(index+1))
 
+    #Edits in a row are written together, once no snap has changed for SNAP_SAVE_TICKS ticks
     def _save_snaps(self):
-        data = []
-        for snap in self.snaps:
-            data.append(snap.get_data())
-        self._track.set_data('snaps', data)
-        self._snap_data = data
-        self.log('saved snaps')
-        self.log(self._track.get_data('snaps', False))
+        if self._save_ticks is None:
+            self.canonical_parent.schedule_message(1, self._tick_save)
+        self._save_ticks = SNAP_SAVE_TICKS
+
+    def _tick_save(self):
+        if self._save_ticks is None:
+            return
+        self._save_ticks -= 1
+        if self._save_ticks > 0:
+            self.canonical_parent.schedule_message(1, self._tick_save)
+        else:
+            self.flush_snaps()
+
+    def flush_snaps(self):
+        if self._save_ticks is None:
+            return
+        self._save_ticks = None
+        self._snap_data = [snap.entries() for snap in self.snaps]
+        self._track.set_data('snaps', encode_snaps(self._snap_data))
+        self.debug('Saved snaps of %s', self.short_name)
@@ -1,4 +1,6 @@
 from _EbiagiComponent import EbiagiComponent
+from _utils import catch_exception
+from _Framework.SubjectSlot import subject_slot, subject_slot_group
 
 class Router(EbiagiComponent):
 
@@ -8,7 +10,15 @@ class Router(EbiagiComponent):
         self._set = Set
         self._instrument = None
 
+        #Set by a reset, after which every input needs updating rather than only changed ones
+        self.reset_pending = False
+        self._reset_scheduled = False
+
         self._device = track.devices[0]
+        self._chains = {}
+
+        self._on_chains_changed.subject = self._device
+        self._map_chains()
         self._reset()
 
     def set_instrument(self, instrument):
@@ -17,16 +27,50 @@ class Router(EbiagiComponent):
 
     def update_input(self, ipt):
         if self._instrument:
-            for chain in self._device.chains:
-                if chain.name == ipt.short_name:
-                    if ipt.has_instrument(self._instrument):
-                        chain.mute = 0
-                    else:
-                        chain.mute = 1
+            chain = self._chains.get(ipt.short_name)
+            if chain is not None:
+                self._set_mute(chain, 0 if ipt.has_instrument(self._instrument) else 1)
 
     def _reset(self):
-        for chain in self._device.chains:
-            if chain.name == 'THRU':
-                chain.mute = 0
-            else:
-                chain.mute = 1
\ No newline at end of file
+        self.reset_pending = True
+        for name, chain in self._chains.items():
+            self._set_mute(chain, 0 if name == 'THRU' else 1)
+
+    #Only flips are written, as each write is a LOM call that can redraw the device
+    @staticmethod
+    def _set_mute(chain, mute):
+        if chain.mute != mute:
+            chain.mute = mute
+
+    def _map_chains(self):
+        chains = self._device.chains
+        self._chains = dict((chain.name, chain) for chain in chains)
+        self._on_chain_name_changed.replace_subjects(chains)
+
+    #Live does not allow changes from within listeners, so the chains are only muted on the next tick
+    def _schedule_reset(self):
+        if not self._reset_scheduled:
+            self._reset_scheduled = True
+            self.canonical_parent.schedule_message(1, self._scheduled_reset)
+
+    @catch_exception
+    def _scheduled_reset(self):
+        if self._reset_scheduled:
+            self._reset_scheduled = False
+            self._reset()
+            #The reset muted the chains of held inputs too; reset_pending makes this update cover every input
+            self._set._update_routers()
+
+    @subject_slot('chains')
+    def _on_chains_changed(self):
+        self._map_chains()
+        self._schedule_reset()
+
+    @subject_slot_group('name')
+    def _on_chain_name_changed(self, chain):
+        self._map_chains()
+        self._schedule_reset()
+
+    def disconnect(self):
+        self._reset_scheduled = False
+        super(Router, self).disconnect()
@@ -1,3 +1,4 @@
+from contextlib import contextmanager
 from _EbiagiComponent import EbiagiComponent
 from _naming_conventions import *
 from _Module import Module
@@ -5,15 +6,49 @@ from _Input import Input
 from _Router import Router
 from _Instrument import Instrument
 from _SnapControl import SnapControl
+from _Topology import Topology, SceneIndex
+from _GetState import StateCache
+from _ClipIndex import ClipNameIndex
+from _LiveWrites import LiveWrites
+from _SwitchPlan import SwitchPlan
+from _utils import catch_exception, live_key
+from _Metrics import timed, record, timer
+from _Framework.SubjectSlot import subject_slot, subject_slot_group
 
 class Set(EbiagiComponent):
 
+    @timed('set.load')
     def __init__(self):
         super(Set, self).__init__()
 
         self.loading = True
         self.log('Loading Set...')
 
+        self._pending_tracks = False
+        self._pending_scenes = False
+        self._refresh_scheduled = False
+
+        self._batch_depth = 0
+        self._dirty_inputs = set([])
+        self.writes = LiveWrites(self)
+        self._switch_plans = {}
+
+        self._state_listeners = []
+        self.state_cache = StateCache(self)
+
+        with self.batch():
+            self._load()
+
+            self._on_tracks_changed.subject = self._song
+            self._on_scenes_changed.subject = self._song
+            self._on_metronome_changed.subject = self._song
+
+            if len(self.modules):
+                self.activate_module(0)
+                self.loading = False
+                self.message('Loaded Ebiagi Set')
+
+    def _load(self):
         self.inputs = {}
 
         self.midi_routers = []
@@ -28,28 +63,37 @@ class Set(EbiagiComponent):
         self.global_loop = None
 
         self.held_instruments = set([])
+        self._switch_plans = {}
+
+        self.topology = Topology(self._song.tracks)
+        self.scene_index = SceneIndex(self._song.scenes)
+        self._instruments_by_position = {}
+        self._clip_indexes = {}
 
         m = 0
         a = 0
-        for track in self._song.tracks:
+        #Track names were classified once by the Topology
+        topology = self.topology
+
+        #Add inputs
+        for track in topology.tracks_of_kind(INPUT):
+            ipt = Input(track, self)
+            self.inputs[ipt.short_name] = ipt
 
-            #Add inputs
-            if is_input(track.name):
-                ipt = Input(track, self)
-                self.inputs[ipt.short_name] = ipt
+        #Add midi routers
+        for track in topology.tracks_of_kind(MIDI_ROUTER):
+            self.midi_routers.append(Router(track, self))
 
-            #Add midi routers       
-            if is_midi_router(track.name):
-                self.midi_routers.append(Router(track, self)) 
-            
-            #Add audio routers       
-            if is_audio_router(track.name):
-                self.audio_routers.append(Router(track, self))
+        #Add audio routers
+        for track in topology.tracks_of_kind(AUDIO_ROUTER):
+            self.audio_routers.append(Router(track, self))
 
-        for track in self._song.tracks:
+        #Global instruments and the snap control take routers in song order
+        for track in topology.tracks_of_kind(GLOBAL_INSTRUMENT, SNAP_CONTROL, GLOBAL_LOOP):
+            kind = describe(track.name).kind
 
             #Add Global Instrument
-            if is_global_instrument(track.name):
+            if kind == GLOBAL_INSTRUMENT:
                 instr = Instrument(track, self)
                 if instr.has_midi_input():
                     instr.set_midi_router(self.midi_routers[m])
@@ -58,47 +102,311 @@ class Set(EbiagiComponent):
                     instr.set_audio_router(self.audio_routers[a])
                     a += 1
                 self.global_instruments.append(instr)
+                self.register_instrument(instr)
 
             #Add Snap Control
-            if is_snap_control(track.name):
+            if kind == SNAP_CONTROL:
                 sc = SnapControl(track, self)
                 sc.set_midi_router(self.midi_routers[m])
                 m += 1
                 self.snap_control = sc
+                self.register_instrument(sc)
 
             #Add global loop
-            if is_global_loop_track(track.name):
+            if kind == GLOBAL_LOOP:
                 self.global_loop = track.clip_slots[0]
 
-        for track in self._song.tracks:
-
-            #Add modules
-            if is_module(track.name):
-                module = Module(track, self, m, a)
-                self.modules.append(module)
+        #Module instruments share the routers left after the global ones
+        self._module_m = m
+        self._module_a = a
+
+        #Add modules
+        for track in topology.tracks_of_kind(MODULE):
+            module = Module(track, self, m, a)
+            self.modules.append(module)
+            module.deactivate()
+
+        self._on_global_loop_playing_status_changed.subject = self.global_loop
+        self._on_global_loop_recording_changed.subject = self.global_loop
+
+        self._globals_signature = self._get_globals_signature()
+        self._on_track_name_changed.replace_subjects(self.topology.tracks)
+        self._on_track_color_changed.replace_subjects(self.topology.tracks)
+        self._on_scene_name_changed.replace_subjects(self.scene_index.scenes)
+
+    #Tracks outside of modules; any change to these needs a full reload
+    def _get_globals_signature(self):
+        signature = []
+        for track in self.topology.tracks_of_kind(INPUT, MIDI_ROUTER, AUDIO_ROUTER, GLOBAL_LOOP, GLOBAL_INSTRUMENT, SNAP_CONTROL):
+            if describe(track.name).kind in INSTRUMENT_KINDS:
+                signature.append(Instrument.get_signature(track, self.topology))
+            else:
+                signature.append((live_key(track), track.name))
+        return tuple(signature)
+
+    @subject_slot('tracks')
+    def _on_tracks_changed(self):
+        self._pending_tracks = True
+        self._schedule_refresh()
+
+    @subject_slot('scenes')
+    def _on_scenes_changed(self):
+        self._pending_scenes = True
+        self._schedule_refresh()
+
+    @subject_slot_group('name')
+    def _on_track_name_changed(self, track):
+        self._pending_tracks = True
+        self._schedule_refresh()
+
+    @subject_slot_group('name')
+    def _on_scene_name_changed(self, scene):
+        self._pending_scenes = True
+        self._schedule_refresh()
+
+    @subject_slot_group('color_index')
+    def _on_track_color_changed(self, track):
+        self.state_changed('inputs', 'modules', 'instr')
+
+    @subject_slot('metronome')
+    def _on_metronome_changed(self):
+        self.state_changed('metronome')
+
+    @subject_slot('playing_status')
+    def _on_global_loop_playing_status_changed(self):
+        self.state_changed('globalLoop')
+
+    @subject_slot('is_recording')
+    def _on_global_loop_recording_changed(self):
+        self.state_changed('globalLoop')
+
+    def add_state_listener(self, listener):
+        self._state_listeners.append(listener)
+
+    def remove_state_listener(self, listener):
+        if listener in self._state_listeners:
+            self._state_listeners.remove(listener)
+
+    #Marks get_state sections dirty (all of them when none are given) and tells state listeners
+    def state_changed(self, *sections):
+        self.state_cache.invalidate(sections)
+        for listener in self._state_listeners:
+            listener(sections)
+
+    def loop_changed(self, key):
+        self.state_cache.invalidate_loop(key)
+        for listener in self._state_listeners:
+            listener(('loops',))
+
+    #Live does not allow changes from within listeners, and edits tend to come in bursts
+    def _schedule_refresh(self):
+        if not self._refresh_scheduled:
+            self._refresh_scheduled = True
+            self.canonical_parent.schedule_message(1, self._refresh)
+
+    @catch_exception
+    def _refresh(self):
+        with self.batch():
+            self._do_refresh()
+
+    def _do_refresh(self):
+        self._refresh_scheduled = False
+        tracks_changed = self._pending_tracks
+        scenes_changed = self._pending_scenes
+        self._pending_tracks = False
+        self._pending_scenes = False
+
+        if scenes_changed:
+            self.scene_index = SceneIndex(self._song.scenes)
+
+        if tracks_changed:
+            self.topology = Topology(self._song.tracks)
+            if self._get_globals_signature() != self._globals_signature:
+                self._reload()
+                return
+            self._refresh_modules(scenes_changed)
+            self._on_track_name_changed.replace_subjects(self.topology.tracks)
+            self._on_track_color_changed.replace_subjects(self.topology.tracks)
+
+        elif scenes_changed:
+            for module in self.modules:
+                module.refresh_loops()
+
+        if scenes_changed:
+            self._on_scene_name_changed.replace_subjects(self.scene_index.scenes)
+
+        self.state_changed()
+
+    def _refresh_modules(self, scenes_changed):
+        self._switch_plans = {}
+        self._instruments_by_position = {}
+        for instr in self.global_instruments:
+            self.register_instrument(instr)
+        if self.snap_control:
+            self.register_instrument(self.snap_control)
+
+        existing = dict((live_key(module._track), module) for module in self.modules)
+        modules = []
+        removed = []
+        for track in self.topology.tracks_of_kind(MODULE):
+            module = existing.pop(live_key(track), None)
+            if not module:
+                module = Module(track, self, self._module_m, self._module_a)
                 module.deactivate()
+            elif module.signature != Module.get_signature(track, self.topology):
+                added, dropped = module.refresh()
+                removed.extend(dropped)
+                for instr in added:
+                    if module is self.active_module:
+                        instr.activate()
+                    else:
+                        instr.deactivate()
+            else:
+                for instr in module.instruments:
+                    self.register_instrument(instr)
+                if scenes_changed:
+                    module.refresh_loops()
+            modules.append(module)
+
+        for module in existing.values():
+            removed.extend(module.instruments)
+            module.disconnect()
+
+        for key, clip_index in list(self._clip_indexes.items()):
+            if not self.topology.has_track(clip_index._track):
+                clip_index.disconnect()
+                del self._clip_indexes[key]
+
+        for instr in removed:
+            self._forget_instrument(instr)
+
+        self.modules = modules
+        if self.active_module in modules:
+            #Refreshed modules may have taken over routers of the active one
+            for instr in self.active_module.instruments:
+                instr.claim_routers()
+            self._update_routers()
+        else:
+            self.active_module = None
+            if len(modules):
+                self.activate_module(0)
+
+    def _forget_instrument(self, instrument):
+        self.held_instruments.discard(instrument)
+        instrument.deselect()
+        for router in (instrument._midi_router, instrument._audio_router):
+            if router and router._instrument is instrument:
+                router.set_instrument(None)
+        for ipt in self.inputs.values():
+            if ipt.phantom_instrument is instrument:
+                ipt.phantom_instrument = None
+
+    #Tracks outside of modules changed, so everything is rebuilt, keeping the active module and snap
+    def _reload(self):
+        self.log('Reloading Set...')
+        active = self.active_module.short_name if self.active_module else None
+        snap = None
+        if self.active_module and self.snap_control and self.snap_control.selected_snap in self.active_module.snaps:
+            snap = self.active_module.snaps.index(self.snap_control.selected_snap)
+
+        self._disconnect_model()
+        self._load()
 
         if len(self.modules):
-            self.activate_module(0)
+            index = next((i for i, module in enumerate(self.modules) if module.short_name == active), 0)
+            self.activate_module(index)
+            if snap is not None and self.snap_control:
+                self.snap_control.select_snap(self.active_module.snaps[snap])
             self.loading = False
-            self.message('Loaded Ebiagi Set')
+        else:
+            self.loading = True
+        self.state_changed()
 
-    def activate_module(self, index):
-        if self.modules[index]:
-            if self.modules[index] != self.active_module:
+    def _disconnect_model(self):
+        for clip_index in self._clip_indexes.values():
+            clip_index.disconnect()
+        for ipt in self.inputs.values():
+            ipt.disconnect()
+        for router in self.midi_routers + self.audio_routers:
+            router.disconnect()
+        for module in self.modules:
+            module.disconnect()
+        for instr in self.global_instruments:
+            instr.disconnect()
+        if self.snap_control:
+            self.snap_control.disconnect()
+
+    def disconnect(self):
+        self._disconnect_model()
+        #Scheduled refreshes and plan warm-ups then find nothing to do
+        self.active_module = None
+        self._pending_tracks = False
+        self._pending_scenes = False
+        super(Set, self).disconnect()
+
+    def register_instrument(self, instrument):
+        self._instruments_by_position[self.topology.position(instrument._track)] = instrument
 
-                if self.active_module:
-                    self.active_module.deactivate()
+    #Instrument owning track, either as its main track or as one of its X[ ] ex-tracks
+    def instrument_for_track(self, track):
+        return self._instruments_by_position.get(self.topology.owner_position(track))
 
-                for router in self.midi_routers and self.audio_routers:
-                    router.set_instrument(None)
+    #Clip name index of a track, created for tracks whose clips use PLAY commands
+    def clip_index(self, track):
+        key = live_key(track)
+        if key not in self._clip_indexes:
+            self._clip_indexes[key] = ClipNameIndex(track)
+        return self._clip_indexes[key]
 
-                self.modules[index].activate()
-                self.active_module = self.modules[index]
+    def activate_module(self, index):
+        if self.modules[index]:
+            if self.modules[index] != self.active_module:
+                start = timer()
+                module = self.modules[index]
+                with self.batch():
+                    self._switch_module(self.active_module, module)
+                #Inside an outer batch, the writes are applied when that batch ends
+                record('module_switch', (timer() - start) * 1000)
+                self.state_changed()
+                self.canonical_parent.schedule_message(1, self._warm_switch_plans)
             else:
                 self.message('Module already active')
         else:
-            self.log('Module index out of bounds')
+            self.warn('Module index out of bounds')
+
+    #Applies the switch plan; global instruments keep their routers
+    def _switch_module(self, old, new):
+        plan = self._switch_plan(old, new)
+        if old:
+            old.set_active(False)
+        for router in plan.released:
+            router.set_instrument(None)
+        self.writes.write_all(plan.writes)
+        new.set_active(True)
+        for instrument in new.instruments:
+            instrument.claim_routers()
+        self.active_module = new
+
+    def _switch_plan(self, old, new):
+        key = (live_key(old._track) if old else None, live_key(new._track))
+        plan = self._switch_plans.get(key)
+        if plan is None:
+            plan = SwitchPlan(old, new)
+            self._switch_plans[key] = plan
+        return plan
+
+    #Builds the plans away from the active module, and the other modules' loop listeners, on an idle
+    #tick, so the next switch only applies one
+    @catch_exception
+    def _warm_switch_plans(self):
+        if self.active_module in self.modules:
+            for module in self.modules:
+                if module is not self.active_module:
+                    self._switch_plan(self.active_module, module)
+                    module.observe_loops()
+
+    def invalidate_switch_plans(self):
+        self._switch_plans = {}
 
     def toggle_input(self, key):
         self.inputs[key].toggle()
@@ -106,10 +414,11 @@ class Set(EbiagiComponent):
     def select_instrument(self, index, instrument=None):
         if not instrument:
             instrument = self.active_module.instruments[index]
-        self.log(instrument.short_name)
+        self.debug('Selecting %s', instrument.short_name)
         self.held_instruments.add(instrument)
         instrument.select()
-        self._update_routers()
+        self._update_routers(instrument.inputs())
+        self.state_changed('inputs', 'instr', 'ginstr')
 
     def deselect_instrument(self, index, instrument=None):
         if not instrument:
@@ -117,7 +426,8 @@ class Set(EbiagiComponent):
         if instrument in self.held_instruments: 
             self.held_instruments.remove(instrument)
         instrument.deselect()
-        self._update_routers()
+        self._update_routers(instrument.inputs())
+        self.state_changed('inputs', 'instr', 'ginstr')
 
     def stop_instrument(self, index, instrument=None):
         if not instrument:
@@ -163,12 +473,14 @@ class Set(EbiagiComponent):
         param = self._song.view.selected_parameter
         track = self._song.view.selected_track
         self.active_module.assign_snap(index, param, track)
+        self.state_changed('snaps')
 
     def clear_snap(self, index):
         self.active_module.clear_snap(index)
+        self.state_changed('snaps')
 
-    def recall_snap(self, beats):
-        self.snap_control.ramp(beats)
+    def recall_snap(self, beats, curve='linear'):
+        self.snap_control.ramp(beats, curve)
 
     def select_global_instrument(self, index):
         self.select_instrument(None, self.global_instruments[index])
@@ -197,20 +509,41 @@ class Set(EbiagiComponent):
     def toggle_metronome(self):
         self._song.metronome = not self._song.metronome
 
-    #TODO: Performance can be improved by mapping names
     def get_scene_index(self, name):
-        i = 0
-        for scene in self._song.scenes:
-            if name == scene.name:
-                return i
-            i += 1
-
-    def _update_routers(self):
-        for ipt in self.inputs.values():
-            if not ipt.empty():
-                if ipt.has_midi_input:
-                    for router in self.midi_routers:
-                        router.update_input(ipt)
-                if ipt.has_audio_input:
-                    for router in self.audio_routers:
+        return self.scene_index.by_name(name)
+
+    #Groups several actions so that router updates and property writes run once at the end
+    @contextmanager
+    def batch(self):
+        self._batch_depth += 1
+        self.writes.buffering = True
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                if self._dirty_inputs:
+                    inputs = self._dirty_inputs
+                    self._dirty_inputs = set([])
+                    self._do_update_routers(inputs)
+                self.writes.buffering = False
+                self.writes.flush()
+
+    #Routers only need updating on the inputs whose instruments changed; None means all inputs
+    def _update_routers(self, inputs=None):
+        if inputs is None:
+            inputs = self.inputs.values()
+        if self._batch_depth:
+            self._dirty_inputs.update(inputs)
+        else:
+            self._do_update_routers(inputs)
+
+    @timed('update_routers')
+    def _do_update_routers(self, inputs):
+        for routers, midi in ((self.midi_routers, True), (self.audio_routers, False)):
+            for router in routers:
+                router_inputs = self.inputs.values() if router.reset_pending else inputs
+                router.reset_pending = False
+                for ipt in router_inputs:
+                    if not ipt.empty() and (ipt.has_midi_input if midi else ipt.has_audio_input):
                         router.update_input(ipt)
@@ -1,57 +1,109 @@
 from _EbiagiComponent import EbiagiComponent
-from _naming_conventions import *
+
+#Every module has this many snaps
+SNAP_COUNT = 6
+
+#Version of the snap data stored on module tracks. Version 1 was a list per snap of
+#{instr_name, param_index, param_value} dicts; version 2 interns the instrument names and
+#packs each snap as a flat list of (instrument id, param index, value) triples
+SNAP_SCHEMA = 2
+
+def encode_snaps(snaps_entries):
+    names = []
+    ids = {}
+    snaps = []
+    for entries in snaps_entries:
+        packed = []
+        for name, index, value in entries:
+            if name not in ids:
+                ids[name] = len(names)
+                names.append(name)
+            packed.extend((ids[name], index, value))
+        snaps.append(packed)
+    return {'version': SNAP_SCHEMA, 'instruments': names, 'snaps': snaps}
+
+#Entries of each snap as (instrument short name, param index, value), from any known version
+def decode_snaps(data):
+    if isinstance(data, dict) and data.get('version') == SNAP_SCHEMA:
+        names = data['instruments']
+        snaps = []
+        for packed in data['snaps']:
+            snaps.append([(names[packed[i]], packed[i + 1], packed[i + 2]) for i in range(0, len(packed), 3)])
+    elif isinstance(data, list):
+        snaps = [[(d['instr_name'], d['param_index'], d['param_value']) for d in snap] for snap in data]
+    else:
+        snaps = []
+    snaps = snaps[:SNAP_COUNT]
+    return snaps + [[] for i in range(SNAP_COUNT - len(snaps))]
 
 class Snap(EbiagiComponent):
 
-    def __init__(self, data, Module, Set):
+    def __init__(self, entries, Module, Set):
         super(Snap, self).__init__()
         self._set = Set
+        self._module = Module
+
+        #Saved entries are resolved to params when the snap is first used
+        self._saved = list(entries)
+        self._snap_params = None
+        self._entries = None
+
+    #SnapParams keyed by (instrument, parameter index)
+    @property
+    def snap_params(self):
+        if self._snap_params is None:
+            self._resolve()
+        return self._snap_params
 
-        self.snap_params = []
-        self.ramping_params = []
+    #Entries whose instrument or param no longer exists are dropped
+    def _resolve(self):
+        snap_params = {}
+        for name, index, value in self._saved:
+            instrument = self._module.instrument_by_name(name)
+            if instrument and len(instrument._track.devices) > 0:
+                parameters = instrument._track.devices[0].parameters
+                if index < len(parameters):
+                    snap_params[(instrument, index)] = SnapParam(instrument, parameters[index], value, index)
+        self._snap_params = snap_params
+        self._saved = None
 
-        for d in data:
-            for instrument in Module.instruments:
-                if d['instr_name'] == get_short_name(instrument._track.name):
-                    self.snap_params.append(SnapParam(instrument, instrument._track.devices[0].parameters[d['param_index']], d['param_value']))
-        
-        self.log(self.snap_params)
+    #Answered from the saved entries while the snap is unresolved
+    def has_params(self):
+        if self._snap_params is None:
+            return len(self._saved) > 0
+        return len(self._snap_params) > 0
 
+    def create_param(self, instrument, param, index):
+        self.snap_params[(instrument, index)] = SnapParam(instrument, param, param.value, index)
+        self._entries = None
 
-    def create_param(self, instrument, param):
-        self.snap_params.append(SnapParam(instrument, param, param.value))
+    def remove_param(self, instrument, index):
+        self.snap_params.pop((instrument, index), None)
+        self._entries = None
 
-    def remove_param(self, param):
-        for snap_param in self.snap_params:
-            if snap_param.param == param:
-                self.snap_params.remove(snap_param)
+    def has_param(self, instrument, index):
+        return (instrument, index) in self.snap_params
 
-    def has_param(self, param):
-        for snap_param in self.snap_params:
-            if snap_param.param == param:
-                return True
-        else:
-            return False
+    #Kept until the snap changes, so saving one snap does not re-read the others
+    def entries(self):
+        if self._snap_params is None:
+            return self._saved
+        if self._entries is None:
+            self._entries = [snap_param.entry() for snap_param in self.snap_params.values()]
+        return self._entries
 
-    def get_data(self):
-        data = []
-        for snap_param in self.snap_params:
-            data.append(snap_param.get_data())
-        return data
 
+class SnapParam(object):
 
-class SnapParam:
+    __slots__ = ('instrument', 'param', 'value', 'index')
 
-    def __init__(self, instrument, param, value):
+    def __init__(self, instrument, param, value, index):
         self.instrument = instrument
         self.param = param
         self.value = value
+        self.index = index
 
-    def get_data(self):
-        return {
-            "instr_name": get_short_name(self.instrument._track.name),
-            "param_index": list(self.instrument._track.devices[0].parameters).index(self.param),
-            "param_value": self.value
-        }
+    def entry(self):
+        return (self.instrument.short_name, self.index, self.value)
 
 
@@ -1,9 +1,20 @@
 from _Instrument import Instrument
 from _naming_conventions import *
-from _utils import catch_exception
+from _utils import catch_exception, live_key
+from _Metrics import timed
 from _Framework.SubjectSlot import subject_slot
 from ClyphX_Pro.clyphx_pro.ClyphXComponentBase import add_client, remove_client
-from functools import partial
+import math
+
+#Ramp shapes, mapping progress from 0 to 1 onto the share of the change applied
+RAMP_CURVES = {
+    'linear': lambda x: x,
+    'exp': lambda x: (math.exp(4*x) - 1) / (math.exp(4) - 1),
+    's': lambda x: x*x*(3 - 2*x),
+}
+
+#Continuous params are written in steps of 1/PARAM_STEPS of their range
+PARAM_STEPS = 1000.0
 
 class SnapControl(Instrument):
 
@@ -12,18 +23,19 @@ class SnapControl(Instrument):
         self._track = track
         self._set = Set
 
-        self._snap_map = []
         self.selected_snap = None
 
+        #Morph from the values at snap selection (start) towards the snap (start + diff)
+        self._morph_params = []
+        self._morph_start = []
+        self._morph_diff = []
+        self._morph_position = None
+
         self._knob = self._track.devices[0].parameters[1]
-        self._reset_knob = False
 
         self._on_macro_value_changed.subject = self._knob
 
-        self._last_beat = 0
-        self._last_subdivision = 0
-        self._last_tick = 0
-        self._ramping_params = []
+        self._ramps = {}
 
         add_client(self)
 
@@ -33,78 +45,86 @@ class SnapControl(Instrument):
     def select_snap(self, snap):
         self.selected_snap = snap
         self._set_snap_map(snap)
+        self._set.state_changed('snaps')
 
     def _set_snap_map(self, snap):
-        self._snap_map = []
+        snap_params = list(snap.snap_params.values())
+        self._morph_params = [snap_param.param for snap_param in snap_params]
+        self._morph_start = [param.value for param in self._morph_params]
+        self._morph_diff = [snap_param.value - start for snap_param, start in zip(snap_params, self._morph_start)]
+        #Back at 0 the morph writes nothing, as every param is already at its start value
         self._knob.value = 0
-        self._reset_knob = True
-        for snap_param in snap.snap_params:
-            s = {
-                'param': snap_param.param,
-                'starting_value': snap_param.param.value,
-                'diff': snap_param.value - snap_param.param.value
-            }
-            self._snap_map.append(s)
 
+    #Only the latest knob position is kept; it is applied once per tick
     @subject_slot('value')
     def _on_macro_value_changed(self):
-        if self._reset_knob:
-            self._reset_knob = False
-            return
-        for s in self._snap_map:
-            new_value = s['starting_value'] + s['diff']*self._knob.value/self._knob.max
-            self._tasks.add(partial(self._update_parameter_value, s['param'], new_value))
-
-    def ramp(self, num_beats):
-        for snap_param in self.selected_snap.snap_params:
-
-            if len(self._set.held_instruments) == 0 or (len(self._set.held_instruments) == 1 and self in self._set.held_instruments) or next((x for x in self._set.held_instruments if x == snap_param.instrument), None):
-                
-                #if the param is already ramping, stop that ramp
-                for ramping_param in self._ramping_params:
-                    if ramping_param['param'] == snap_param.param:
-                        self._ramping_params.remove(ramping_param)
-
-                self._ramping_params.append({
-                    'param': snap_param.param,
-                    'beats_remaining': num_beats,
-                    'target_value': snap_param.value
-                })
+        self._morph_position = float(self._knob.value - self._knob.min) / (self._knob.max - self._knob.min)
+
+    def _do_morph(self):
+        position = self._morph_position
+        self._morph_position = None
+        params = self._morph_params
+        start = self._morph_start
+        diff = self._morph_diff
+        #Compared with the param itself, as ramps, recalls and the user move the same params
+        for i in range(len(params)):
+            value = start[i] + diff[i]*position
+            if value != params[i].value:
+                self._update_parameter_value(params[i], value)
+
+    #Ramps run from now to the end of the current beat plus num_beats, in song time so tempo changes are followed
+    def ramp(self, num_beats, curve='linear'):
+        now = self._song.current_song_time
+        end = math.floor(now) + 1 + num_beats
+        shape = RAMP_CURVES[curve]
+
+        held = self._set.held_instruments
+        ramp_all = len(held) == 0 or (len(held) == 1 and self in held)
+
+        for snap_param in self.selected_snap.snap_params.values():
+            if ramp_all or snap_param.instrument in held:
+                #Replaces any ramp already running on the param
+                self._ramps[live_key(snap_param.param)] = Ramp(snap_param.param, snap_param.value, now, end, shape)
 
     @catch_exception
+    @timed('snap_control.on_tick')
     def on_tick(self):
-        if len(self._ramping_params) > 0:
-            self._do_ramp()
-        self._last_beat = self._song.get_current_beats_song_time().beats
-        self._last_subdivision = self._song.get_current_beats_song_time().sub_division
-        self._last_tick = self._song.get_current_beats_song_time().ticks
+        if self._morph_position is not None:
+            self._do_morph()
+        if self._ramps:
+            self._do_ramp(self._song.current_song_time)
 
     @catch_exception
-    def _do_ramp(self):
-        current_tick = self._song.get_current_beats_song_time().ticks
-        tick_difference = float(current_tick - self._last_tick)
-        if tick_difference < 0:
-            tick_difference += 60
-
-        for param in self._ramping_params:
-            ticks_remaining = float(param['beats_remaining']*4*60 + (4 - self._last_subdivision)*60 + 60 - self._last_tick)
-            if ticks_remaining <= 0:
-                self._update_parameter_value(param['param'], param['target_value'])
-                self._ramping_params.remove(param)
+    def _do_ramp(self, now):
+        #Song time stands still while stopped, so ramps would never finish
+        playing = self._song.is_playing
+        finished = []
+        for key, ramp in self._ramps.items():
+            #Song time jumps back on arrangement loops and relocations; the ramp carries on from where it was
+            if now < ramp.last_time:
+                ramp.start += now - ramp.last_time
+                ramp.end += now - ramp.last_time
+            ramp.last_time = now
+
+            done = now >= ramp.end or not playing
+            if done:
+                value = ramp.target_value
+                finished.append(key)
             else:
-                value_difference = float(param['target_value'] - param['param'].value)
-                new_value = tick_difference/ticks_remaining*value_difference + param['param'].value
+                progress = max(0.0, (now - ramp.start) / (ramp.end - ramp.start))
+                value = ramp.start_value + ramp.diff * ramp.shape(progress)
 
-                self._update_parameter_value(param['param'], new_value)
+            if abs(value - ramp.last_value) >= ramp.resolution or (done and value != ramp.last_value):
+                self._update_parameter_value(ramp.param, value)
+                ramp.last_value = value
 
-                if self._song.get_current_beats_song_time().beats != self._last_beat:
-                    param['beats_remaining'] -= 1
-            
+        for key in finished:
+            del self._ramps[key]
 
     def disconnect(self):
         super(SnapControl, self).disconnect()
         remove_client(self)
-        self.ramping_params = []
+        self._ramps = {}
         return
 
     @staticmethod
@@ -113,4 +133,21 @@ class SnapControl(Instrument):
             value = param.max
         elif value < param.min:
             value = param.min
-        param.value = value
\ No newline at end of file
+        param.value = value
+
+
+class Ramp(object):
+
+    __slots__ = ('param', 'start_value', 'target_value', 'diff', 'start', 'end', 'shape', 'resolution', 'last_value', 'last_time')
+
+    def __init__(self, param, target_value, start, end, shape):
+        self.param = param
+        self.start_value = param.value
+        self.target_value = target_value
+        self.diff = target_value - self.start_value
+        self.start = start
+        self.end = end
+        self.shape = shape
+        self.resolution = 1.0 if param.is_quantized else (param.max - param.min) / PARAM_STEPS
+        self.last_value = self.start_value
+        self.last_time = start
@@ -1,8 +1,58 @@
-import socket
-import json
-from threading import Timer
+import time
+from Queue import Full, Empty
 from _EbiagiComponent import EbiagiComponent
+from _SocketWorker import SocketWorker, INBOX_SIZE
+from _GetState import SECTIONS, DIFFED_SECTIONS, key_state, diff_state
+from _WireFormat import ENCODINGS
+from _Metrics import get_metrics, reset_metrics
 
+#Where replies go for senders that have not subscribed, unless the payload has a "reply_port"
+DEFAULT_REPLY_ADDR = ('127.0.0.1', 9004)
+
+#Subscribers not heard from for this long (s) are dropped; any datagram counts, {"event": "keepalive"} included
+CLIENT_TIMEOUT = 30
+
+#A subscriber, keyed by the address it sends from, which is also where its replies go.
+#Subscribe data may hold "encoding", "sections" (only these are sent) and "interval" (least ms between state messages)
+class Client(object):
+
+    __slots__ = ('addr', 'encoding', 'sections', 'interval', 'last_seen', 'last_sent', 'version', 'pending')
+
+    def __init__(self, addr, encoding='json', sections=None, interval=0):
+        self.addr = addr
+        self.encoding = encoding
+        self.sections = sections
+        self.interval = interval
+        self.last_seen = time.time()
+        self.last_sent = 0
+        #State version the client has, and the changes since that it has not been sent yet
+        self.version = 0
+        self.pending = {}
+
+    #Merges changes of the client's sections into the ones it is still owed; like diff_state,
+    #only diffed sections are merged entry by entry, any other section is replaced
+    def add_changes(self, changes):
+        for section, value in changes.items():
+            if self.sections is not None and section not in self.sections:
+                continue
+            old = self.pending.get(section)
+            if section in DIFFED_SECTIONS and isinstance(old, dict) and isinstance(value, dict):
+                merged = dict(old)
+                merged.update(value)
+                self.pending[section] = merged
+            else:
+                self.pending[section] = value
+
+    def due(self, now):
+        return bool(self.pending) and now - self.last_sent >= self.interval
+
+    def filter_state(self, state):
+        if self.sections is None or not isinstance(state, dict):
+            return state
+        return dict((section, value) for section, value in state.items() if section in self.sections)
+
+
+#Runs on Live's main thread; socket I/O, JSON decoding and encoding are done by the SocketWorker
 class Socket(EbiagiComponent):
 
     def __init__(self, base):
@@ -10,57 +60,218 @@ class Socket(EbiagiComponent):
 
         self.base = base
 
-        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self._socket.setblocking(0)
-
-        self._local_addr = ('127.0.0.1', 9005)
-        self._remote_addr = ('127.0.0.1', 9004)
+        self._clients = {}
+        self._version = 0
+        self._sent_state = None
+        self._state_dirty = False
+        self._dirty_sections = set([])
+        self._dropped = 0
 
-        self.bind()
+        self._worker = SocketWorker(('127.0.0.1', 9005))
+        self._worker.start()
 
         def parse():
             self.process()
+            self.send_state_delta()
             self.base.canonical_parent.schedule_message(1, parse)
         parse()
 
-    def bind(self):
-        try:
-            self._socket.bind(self._local_addr)
-            self.log('Starting on: ' + str(self._local_addr) + ', remote addr: ' + str(self._remote_addr))
-        except:
-            msg = 'ERROR: Cannot bind to ' + str(self._local_addr) + ', port in use. Trying again...'
-            self.log(msg)
-            t = Timer(5, self.bind)
-            t.start()
-
-    def send(self, name, obj=None):
-        def jsonReplace(o):
-            return str(o)
+    #Queued for the worker, which encodes and sends it; obj must not be changed afterwards
+    def send(self, name, obj, encoding, addr):
+        return self._post(name, obj, encoding, (addr,))
+
+    def _post(self, name, obj, encoding, addrs):
         try:
-            self._socket.sendto(json.dumps(
-                {"event": name, "data": obj}, default=jsonReplace, ensure_ascii=False), self._remote_addr)
-        except Exception, e:
-            self._socket.sendto(json.dumps(
-                {"event": "error", "data": str(type(e).__name__) + ': ' + str(e.args)}, default=jsonReplace, ensure_ascii=False), self._remote_addr)
-            self.log("Socket Error " + name + ": " + str(e))
+            self._worker.outbox.put_nowait((name, obj, encoding, tuple(addrs)))
+            return True
+        except Full:
+            self.warn('Socket outbox full, %s not sent', name)
+            return False
 
+    #Handles what the worker received since the last tick
     def process(self):
-        try:
-            while 1:
-                data = self._socket.recv(65536)
-                if len(data):
-                    payload = json.loads(data)
-                    self.input_handler(payload)
-        except socket.error:
-            return
-        except Exception, e:
-            self.log("Error: " + str(e.args))
+        for _ in range(INBOX_SIZE):
+            try:
+                kind, data, addr = self._worker.inbox.get_nowait()
+            except Empty:
+                break
+            if kind == 'payload':
+                try:
+                    self.input_handler(data, addr)
+                except Exception, e:
+                    self.error("Error: " + str(e.args))
+            elif kind == 'log':
+                self.log(data)
+            elif kind == 'warn':
+                self.warn(data)
+            else:
+                self.error(data)
+
+        dropped = self._worker.dropped
+        if dropped != self._dropped:
+            self.warn('Socket inbox full, dropped %s datagrams', dropped - self._dropped)
+            self._dropped = dropped
+
+    def input_handler(self, payload, addr):
+        client = self._clients.get(addr)
+        if client:
+            client.last_seen = time.time()
+        reply_addr = self._reply_addr(payload, addr)
 
-    def input_handler(self, payload):
         if payload['event'] == 'get_state':
             state = self.base.get_state()
-            self.send('give_state', state)
+            self.send('give_state', state, self._requested_encoding(payload, 'json'), reply_addr)
+        elif payload['event'] == 'subscribe':
+            self.subscribe(addr, payload)
+        elif payload['event'] == 'unsubscribe':
+            self.unsubscribe(addr)
+        elif payload['event'] == 'action':
+            self.run_actions(payload.get('id'), [payload['data']], addr, reply_addr)
+        elif payload['event'] == 'actions':
+            self.run_actions(payload.get('id'), payload['data'], addr, reply_addr)
+        elif payload['event'] == 'get_metrics':
+            self.send('metrics', self.metrics(), 'json', reply_addr)
+        elif payload['event'] == 'reset_metrics':
+            reset_metrics()
+            if self.base.set:
+                self.base.set.writes.reset_counts()
+            self.send('metrics', self.metrics(), 'json', reply_addr)
+
+    #Subscribers are replied to where they send from; anyone else on DEFAULT_REPLY_ADDR,
+    #or on the sender's host at the "reply_port" of the payload
+    def _reply_addr(self, payload, addr):
+        if addr in self._clients:
+            return addr
+        port = payload.get('reply_port')
+        if isinstance(port, int) and not isinstance(port, bool) and 0 < port < 65536:
+            return (addr[0], port)
+        return DEFAULT_REPLY_ADDR
+
+    #Latency histograms, plus the Live write counts of the current set under live_writes
+    def metrics(self):
+        metrics = get_metrics()
+        if self.base.set:
+            metrics['live_writes'] = self.base.set.writes.counts()
+        return metrics
+
+    #Several actions can share one datagram; they are acknowledged together
+    def run_actions(self, batch_id, actions, addr, reply_addr):
+        client = self._clients.get(addr)
+        results = self.base.run_actions(actions)
+        self.send('ack', {'id': batch_id, 'results': results}, client.encoding if client else 'json', reply_addr)
+        self.send_state_delta()
+
+    #Clients opt into the binary wire format with {"encoding": "binary"} in the event data
+    def _requested_encoding(self, payload, default):
+        data = payload.get('data')
+        if isinstance(data, dict) and data.get('encoding') in ENCODINGS:
+            return data['encoding']
+        return default
+
+    def subscribe(self, addr, payload):
+        data = payload.get('data')
+        if not isinstance(data, dict):
+            data = {}
+        sections = data.get('sections')
+        if isinstance(sections, list):
+            sections = frozenset(section for section in sections if section in SECTIONS)
+        else:
+            sections = None
+        try:
+            interval = max(0, float(data.get('interval', 0))) / 1000
+        except (TypeError, ValueError):
+            interval = 0
+
+        #Existing subscribers are brought up to date first, so the new one starts from the same version
+        self.send_state_delta()
+        client = Client(addr, self._requested_encoding(payload, 'json'), sections, interval)
+        self._clients[addr] = client
+        self.log('Client %s:%s subscribed', addr[0], addr[1])
+
+        state = self.base.get_state()
+        if self._sent_state is None:
+            self._version += 1
+            self._sent_state = key_state(state) if isinstance(state, dict) else state
+        self._send_state([client], state)
+
+    def unsubscribe(self, addr, reason='unsubscribed'):
+        if self._clients.pop(addr, None):
+            self.log('Client %s:%s %s', addr[0], addr[1], reason)
+        if not self._clients:
+            self._sent_state = None
+
+    #Called by the Set when state changes; the delta goes out once per tick, however many changes there were
+    def state_changed(self, sections=()):
+        if not self._clients:
+            return
+        if not sections:
+            self._dirty_sections = None
+        elif self._dirty_sections is not None:
+            self._dirty_sections.update(sections)
+        self._state_dirty = True
+
+    #Clients with the same encoding and sections share one message, encoded once by the worker
+    def _send_state(self, clients, state):
+        groups = {}
+        for client in clients:
+            groups.setdefault((client.encoding, client.sections), []).append(client)
+        for (encoding, sections), group in groups.items():
+            data = {'version': self._version, 'state': group[0].filter_state(state)}
+            if self._post('state', data, encoding, [client.addr for client in group]):
+                self._mark_sent(group)
+
+    #Diffs the state once per tick; each client is then sent what it is owed once its interval has passed
+    def send_state_delta(self):
+        if self._state_dirty:
+            self._update_state()
+
+        #Clients that last got the same version with the same sections are owed the same changes
+        now = time.time()
+        groups = {}
+        for client in self._clients.values():
+            if client.due(now):
+                groups.setdefault((client.encoding, client.sections, client.version), []).append(client)
+        for (encoding, sections, version), group in groups.items():
+            data = {'version': self._version, 'changes': group[0].pending}
+            if self._post('state_delta', data, encoding, [client.addr for client in group]):
+                self._mark_sent(group)
+
+        self._drop_stale_clients(now)
+
+    #Sent changes are handed over to the worker, so clients get a new pending dict rather than a cleared one
+    def _mark_sent(self, clients):
+        now = time.time()
+        for client in clients:
+            client.version = self._version
+            client.pending = {}
+            client.last_sent = now
+
+    def _update_state(self):
+        sections = self._dirty_sections
+        self._state_dirty = False
+        self._dirty_sections = set([])
+
+        state = self.base.get_state()
+        if not isinstance(state, dict) or not isinstance(self._sent_state, dict):
+            self._version += 1
+            self._sent_state = key_state(state) if isinstance(state, dict) else state
+            self._send_state(self._clients.values(), state)
+            return
+
+        keyed = key_state(state)
+        changes = diff_state(self._sent_state, keyed, sections)
+        for section in sections or keyed.keys():
+            self._sent_state[section] = keyed[section]
+        if changes:
+            self._version += 1
+            for client in self._clients.values():
+                client.add_changes(changes)
+
+    def _drop_stale_clients(self, now):
+        for addr, client in list(self._clients.items()):
+            if now - client.last_seen > CLIENT_TIMEOUT:
+                self.unsubscribe(addr, 'timed out')
 
     def disconnect(self):
         super(Socket, self).disconnect()
-        self._socket.close()
\ No newline at end of file
+        self._worker.stop()
\ No newline at end of file
@@ -0,0 +1,109 @@
+import socket
+import json
+import select
+import threading
+from Queue import Queue, Full, Empty
+from _WireFormat import encode, encode_json
+
+#Cross-thread rule: the worker thread owns the UDP socket and shares nothing with Live's main thread
+#but the two queues and the dropped counter. Live's API, the Set, the components and the logger are
+#main thread only, so the worker reports through the inbox instead of logging. Anything put on the
+#outbox is encoded later on the worker thread, so the main thread must not change it afterwards.
+
+INBOX_SIZE = 256
+OUTBOX_SIZE = 256
+
+#Seconds the worker waits for datagrams before it sends what is queued on the outbox
+POLL_INTERVAL = 0.01
+#Seconds between attempts to bind while the port is in use
+BIND_RETRY = 5
+
+class SocketWorker(threading.Thread):
+
+    def __init__(self, local_addr):
+        super(SocketWorker, self).__init__(name='EbiagiSocket')
+        self.daemon = True
+        self.local_addr = local_addr
+
+        #(kind, data, addr): ('payload', decoded JSON, sender address), or ('log' | 'warn' | 'error', message, None)
+        self.inbox = Queue(INBOX_SIZE)
+        #(event, data, encoding, addrs): encoded once and sent to every address
+        self.outbox = Queue(OUTBOX_SIZE)
+        #Datagrams dropped because the inbox was full; only written by the worker
+        self.dropped = 0
+
+        self._stopping = threading.Event()
+
+        #Bound before the thread starts, so that datagrams sent right after loading are not lost;
+        #only the retries, while the port is in use, are left to the worker
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(0)
+        self._bound = self._bind()
+
+    def stop(self):
+        self._stopping.set()
+        self.join(1)
+
+    def run(self):
+        try:
+            while not self._bound:
+                if self._stopping.wait(BIND_RETRY):
+                    return
+                self._bound = self._bind()
+            while not self._stopping.is_set():
+                self._send_all()
+                if select.select([self._socket], [], [], POLL_INTERVAL)[0]:
+                    self._receive_all()
+            self._send_all()
+        finally:
+            self._socket.close()
+
+    def _bind(self):
+        try:
+            self._socket.bind(self.local_addr)
+            self._report('log', 'Starting on: ' + str(self.local_addr))
+            return True
+        except socket.error:
+            self._report('warn', 'Cannot bind to ' + str(self.local_addr) + ', port in use. Trying again...')
+            return False
+
+    def _report(self, kind, message):
+        try:
+            self.inbox.put_nowait((kind, message, None))
+        except Full:
+            pass
+
+    def _receive_all(self):
+        while 1:
+            try:
+                data, addr = self._socket.recvfrom(65536)
+            except socket.error:
+                return
+            if not len(data):
+                continue
+            try:
+                payload = json.loads(data)
+            except ValueError, e:
+                self._report('error', 'Error: ' + str(e.args))
+                continue
+            try:
+                self.inbox.put_nowait(('payload', payload, addr))
+            except Full:
+                self.dropped += 1
+
+    def _send_all(self):
+        while 1:
+            try:
+                event, data, encoding, addrs = self.outbox.get_nowait()
+            except Empty:
+                return
+            try:
+                message = encode(event, data, encoding)
+            except Exception, e:
+                message = encode_json("error", str(type(e).__name__) + ': ' + str(e.args))
+                self._report('error', 'Socket Error ' + event + ': ' + str(e))
+            for addr in addrs:
+                try:
+                    self._socket.sendto(message, addr)
+                except socket.error, e:
+                    self._report('error', 'Socket Error ' + event + ': ' + str(e))
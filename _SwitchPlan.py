@@ -0,0 +1,24 @@
+from collections import OrderedDict
+from _utils import live_key
+
+#Net Live writes and router releases that move the active module from one module to another.
+#A plan only depends on the two modules' tracks, so the Set keeps it until those change.
+class SwitchPlan(object):
+
+    def __init__(self, from_module, to_module):
+        self.from_module = from_module
+        self.to_module = to_module
+
+        #Later writes to the same property replace earlier ones
+        writes = OrderedDict()
+        if from_module:
+            for obj, name, value in from_module.deactivation_writes():
+                writes[(live_key(obj), name)] = (obj, name, value)
+        for obj, name, value in to_module.activation_writes():
+            writes[(live_key(obj), name)] = (obj, name, value)
+        self.writes = tuple(writes.values())
+
+        #Module routers used by the outgoing instruments that the incoming ones do not claim
+        claimed = set(to_module.routers())
+        released = from_module.routers() if from_module else []
+        self.released = tuple(router for router in released if router not in claimed)
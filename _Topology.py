@@ -0,0 +1,124 @@
+from _naming_conventions import *
+from _utils import live_key
+
+#Immutable index of the song's track layout, built in a single pass over song.tracks
+class Topology(object):
+
+    def __init__(self, tracks):
+        self.tracks = tuple(tracks)
+
+        positions = {}
+        parents = []
+        children = {}
+        module_members = {}
+        ex_tracks = {}
+        owners = {}
+        kinds = {}
+
+        module = None
+        owner = None
+
+        for i, track in enumerate(self.tracks):
+            positions[live_key(track)] = i
+            info = describe(track.name)
+            kinds.setdefault(info.kind, []).append(i)
+
+            #Group parent/children
+            parent = None
+            if track.is_grouped and track.group_track is not None:
+                parent = positions.get(live_key(track.group_track))
+            parents.append(parent)
+            if parent is not None:
+                children.setdefault(parent, []).append(i)
+
+            #Module membership: grouped tracks following a module track
+            if info.kind == MODULE:
+                module = i
+                module_members[i] = []
+            elif module is not None and track.is_grouped:
+                module_members[module].append(i)
+            else:
+                module = None
+
+            #X[ ] ex-tracks belong to the instrument track right before them
+            if info.kind == EX_TRACK:
+                if owner is not None:
+                    ex_tracks[owner].append(i)
+                    owners[i] = owner
+            elif info.kind in INSTRUMENT_KINDS:
+                owner = i
+                ex_tracks[i] = []
+                owners[i] = i
+            else:
+                owner = None
+
+        self._positions = positions
+        self._parents = tuple(parents)
+        self._children = dict((k, tuple(v)) for k, v in children.items())
+        self._module_members = dict((k, tuple(v)) for k, v in module_members.items())
+        self._ex_tracks = dict((k, tuple(v)) for k, v in ex_tracks.items())
+        self._owners = owners
+        self._kinds = dict((k, tuple(v)) for k, v in kinds.items())
+
+    def position(self, track):
+        return self._positions[live_key(track)]
+
+    #Tracks of the given kinds (see _naming_conventions), in song order
+    def tracks_of_kind(self, *kinds):
+        positions = []
+        for kind in kinds:
+            positions.extend(self._kinds.get(kind, ()))
+        if len(kinds) > 1:
+            positions.sort()
+        return tuple(self.tracks[i] for i in positions)
+
+    def has_track(self, track):
+        return live_key(track) in self._positions
+
+    def parent(self, track):
+        i = self._parents[self.position(track)]
+        return self.tracks[i] if i is not None else None
+
+    def children(self, track):
+        return tuple(self.tracks[i] for i in self._children.get(self.position(track), ()))
+
+    def module_tracks(self, track):
+        return tuple(self.tracks[i] for i in self._module_members.get(self.position(track), ()))
+
+    def ex_tracks(self, track):
+        return tuple(self.tracks[i] for i in self._ex_tracks.get(self.position(track), ()))
+
+    #Position of the instrument track that owns track (itself for instrument tracks), or None
+    def owner_position(self, track):
+        return self._owners.get(self.position(track))
+
+
+#Immutable index of the song's scenes by object, name and short name
+class SceneIndex(object):
+
+    def __init__(self, scenes):
+        self.scenes = tuple(scenes)
+
+        positions = {}
+        names = {}
+        short_names = {}
+        for i, scene in enumerate(self.scenes):
+            positions[live_key(scene)] = i
+            #First match wins, as with a scan from the top
+            names.setdefault(scene.name, i)
+            short_name = describe(scene.name).short_name
+            if short_name is not None:
+                short_names.setdefault(short_name, i)
+
+        self._positions = positions
+        self._names = names
+        self._short_names = short_names
+
+    def position(self, scene):
+        return self._positions[live_key(scene)]
+
+    def by_name(self, name):
+        return self._names.get(name)
+
+    def by_short_name(self, short_name):
+        return self._short_names.get(short_name)
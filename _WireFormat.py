@@ -0,0 +1,180 @@
+import json
+import struct
+from _GetState import key_state
+
+#Binary frames: header (magic, wire version, event, state version) followed by the event body.
+#State events carry one record per section; every other event carries its JSON message as body.
+WIRE_VERSION = 1
+MAGIC = b'EB'
+HEADER = struct.Struct('>2sBBI')
+
+EVENT_JSON = 0
+EVENT_STATE = 1
+EVENT_STATE_DELTA = 2
+
+#Interned colour palette; REMOVED marks entries dropped in a delta
+COLORS = ('dark', 'white', 'blue', 'pink', 'lavender', 'red', 'green', 'gold', 'orange', 'teal', 'purple')
+COLOR_IDS = dict((color, i) for i, color in enumerate(COLORS))
+REMOVED = 0xFF
+
+SECTION_INPUTS = 1
+SECTION_MODULES = 2
+SECTION_INSTR = 3
+SECTION_LOOPS = 4
+SECTION_SNAPS = 5
+SECTION_GINSTR = 6
+SECTION_GLOBAL_LOOP = 7
+SECTION_METRONOME = 8
+
+INDEXED_SECTIONS = {
+    'modules': SECTION_MODULES,
+    'instr': SECTION_INSTR,
+    'snaps': SECTION_SNAPS,
+    'ginstr': SECTION_GINSTR,
+}
+SECTION_NAMES = dict((v, k) for k, v in INDEXED_SECTIONS.items())
+SECTION_NAMES.update({
+    SECTION_INPUTS: 'inputs',
+    SECTION_LOOPS: 'loops',
+    SECTION_GLOBAL_LOOP: 'globalLoop',
+    SECTION_METRONOME: 'metronome',
+})
+
+ENCODINGS = ('json', 'binary')
+
+
+def encode(event, data, encoding='json'):
+    if encoding == 'binary':
+        return encode_binary(event, data)
+    return encode_json(event, data)
+
+def encode_json(event, data):
+    def jsonReplace(o):
+        return str(o)
+    return json.dumps({"event": event, "data": data}, default=jsonReplace, ensure_ascii=False)
+
+def encode_binary(event, data):
+    if event == 'state' and isinstance(data['state'], dict):
+        return _frame(EVENT_STATE, data['version'], _encode_sections(key_state(data['state'])))
+    if event == 'give_state' and isinstance(data, dict):
+        return _frame(EVENT_STATE, 0, _encode_sections(key_state(data)))
+    if event == 'state_delta':
+        return _frame(EVENT_STATE_DELTA, data['version'], _encode_sections(data['changes']))
+    return _frame(EVENT_JSON, 0, _to_bytes(encode_json(event, data)))
+
+def _frame(event_code, version, body):
+    return HEADER.pack(MAGIC, WIRE_VERSION, event_code, version) + body
+
+def _to_bytes(text):
+    if isinstance(text, bytes):
+        return text
+    return text.encode('utf-8')
+
+def _color_id(entry):
+    return REMOVED if entry is None else COLOR_IDS[entry['color']]
+
+#Brightness of n entries packed into ceil(n/8) bytes, least significant bit first
+def _bitfield(entries):
+    field = bytearray((len(entries) + 7) // 8)
+    for i, entry in enumerate(entries):
+        if entry is not None and entry['brightness']:
+            field[i // 8] |= 1 << (i % 8)
+    return bytes(field)
+
+def _pack_names(names):
+    parts = []
+    for name in names:
+        name = _to_bytes(name)
+        parts.append(struct.pack('>B', len(name)) + name)
+    return b''.join(parts)
+
+def _encode_sections(sections):
+    parts = []
+    for section, value in sections.items():
+        if section in INDEXED_SECTIONS:
+            keys = sorted(value.keys())
+            entries = [value[k] for k in keys]
+            parts.append(struct.pack('>BH', INDEXED_SECTIONS[section], len(keys)))
+            parts.append(struct.pack('>%dH' % len(keys), *keys))
+            parts.append(struct.pack('>%dB' % len(keys), *[_color_id(e) for e in entries]))
+            parts.append(_bitfield(entries))
+        elif section == 'loops':
+            keys = sorted(value.keys())
+            entries = [value[k] for k in keys]
+            parts.append(struct.pack('>BH', SECTION_LOOPS, len(keys)))
+            parts.append(_pack_names(keys))
+            parts.append(struct.pack('>%dB' % len(keys), *[_color_id(e) for e in entries]))
+            parts.append(_bitfield(entries))
+        elif section == 'inputs':
+            keys = sorted(value.keys())
+            colors = [REMOVED if value[k] is None else COLOR_IDS[value[k]] for k in keys]
+            parts.append(struct.pack('>BH', SECTION_INPUTS, len(keys)))
+            parts.append(_pack_names(keys))
+            parts.append(struct.pack('>%dB' % len(keys), *colors))
+        elif section == 'globalLoop':
+            #Sent whole, as diff_state only splits up KEYED_SECTIONS and inputs
+            if 'color' not in value or 'brightness' not in value:
+                raise ValueError('Incomplete globalLoop record: %r' % (value,))
+            parts.append(struct.pack('>BBB', SECTION_GLOBAL_LOOP, COLOR_IDS[value['color']], value['brightness']))
+        elif section == 'metronome':
+            parts.append(struct.pack('>BB', SECTION_METRONOME, 1 if value else 0))
+    return b''.join(parts)
+
+
+#Reverse of encode_binary, for clients and tools; returns (event, data) shaped like the JSON messages
+def decode_binary(frame):
+    magic, version, event_code, state_version = HEADER.unpack_from(frame, 0)
+    if magic != MAGIC or version != WIRE_VERSION:
+        raise ValueError('Unsupported frame')
+    body = bytearray(frame[HEADER.size:])
+    if event_code == EVENT_JSON:
+        message = json.loads(bytes(body).decode('utf-8'))
+        return message['event'], message['data']
+    sections = _decode_sections(body)
+    if event_code == EVENT_STATE_DELTA:
+        return 'state_delta', {'version': state_version, 'changes': sections}
+    return 'state', {'version': state_version, 'state': sections}
+
+def _decode_sections(body):
+    sections = {}
+    i = 0
+    while i < len(body):
+        section_id = body[i]
+        name = SECTION_NAMES[section_id]
+        if section_id == SECTION_GLOBAL_LOOP:
+            sections[name] = {'color': COLORS[body[i + 1]], 'brightness': body[i + 2]}
+            i += 3
+            continue
+        if section_id == SECTION_METRONOME:
+            sections[name] = body[i + 1] == 1
+            i += 2
+            continue
+        count = struct.unpack_from('>H', bytes(body[i + 1:i + 3]))[0]
+        i += 3
+        if name in INDEXED_SECTIONS:
+            keys = list(struct.unpack_from('>%dH' % count, bytes(body[i:i + 2*count])))
+            i += 2*count
+        else:
+            keys = []
+            for _ in range(count):
+                length = body[i]
+                keys.append(bytes(body[i + 1:i + 1 + length]).decode('utf-8'))
+                i += 1 + length
+        colors = body[i:i + count]
+        i += count
+        entries = {}
+        if section_id == SECTION_INPUTS:
+            for key, color in zip(keys, colors):
+                entries[key] = None if color == REMOVED else COLORS[color]
+        else:
+            field = body[i:i + (count + 7) // 8]
+            i += (count + 7) // 8
+            key_name = 'key_name' if section_id == SECTION_LOOPS else 'index'
+            for n, (key, color) in enumerate(zip(keys, colors)):
+                if color == REMOVED:
+                    entries[key] = None
+                else:
+                    brightness = (field[n // 8] >> (n % 8)) & 1
+                    entries[key] = {key_name: key, 'color': COLORS[color], 'brightness': brightness}
+        sections[name] = entries
+    return sections
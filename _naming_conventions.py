@@ -1,51 +1,123 @@
 import re 
+from collections import namedtuple
+
+SHORT_NAME_PATTERN = re.compile(r"\[([A-Za-z0-9_ ,-.]+)\]")
+CLIP_NAME_PATTERN = re.compile(r'\{([^}]+)')
+CLIP_COMMAND_PARAM_PATTERN = re.compile(r'\(([^)]+)')
+
+#Kinds of tracks and scenes
+INPUT = 'input'
+MIDI_ROUTER = 'midi_router'
+AUDIO_ROUTER = 'audio_router'
+GLOBAL_INSTRUMENT = 'global_instrument'
+SNAP_CONTROL = 'snap_control'
+GLOBAL_LOOP = 'global_loop'
+MODULE = 'module'
+INSTRUMENT = 'instrument'
+EX_TRACK = 'ex_track'
+LOOP = 'loop'
+
+PREFIX_KINDS = (
+    ('IN[', INPUT),
+    ('MR[', MIDI_ROUTER),
+    ('AR[', AUDIO_ROUTER),
+    ('GI[', GLOBAL_INSTRUMENT),
+    ('M[', MODULE),
+    ('I[', INSTRUMENT),
+    ('X[', EX_TRACK),
+    ('loop[', LOOP),
+)
+
+#Kinds named {TYPE}[{short name}].[{inputs}]
+INSTRUMENT_KINDS = (INSTRUMENT, GLOBAL_INSTRUMENT, SNAP_CONTROL)
+
+#What a track or scene name says: kind (None if it has no role), short name, inputs of instruments,
+#and whether an ex-track is a source [S] or compiled [C] track
+NameInfo = namedtuple('NameInfo', ['kind', 'short_name', 'inputs', 'is_source', 'is_compiled'])
+
+#Parsed names are cached by name, so a renamed track or scene is parsed again under its new name
+NAME_CACHE_SIZE = 4096
+_names = {}
+
+def describe(name):
+    info = _names.get(name)
+    if info is None:
+        if len(_names) >= NAME_CACHE_SIZE:
+            _names.clear()
+        info = _describe(name)
+        _names[name] = info
+    return info
+
+def _describe(name):
+    short_name = get_short_name(name)
+    if name == 'GLOBAL_LOOP':
+        kind = GLOBAL_LOOP
+    elif short_name == 'SNAP_CONTROL':
+        kind = SNAP_CONTROL
+    else:
+        kind = None
+        for prefix, prefix_kind in PREFIX_KINDS:
+            if name.startswith(prefix):
+                kind = prefix_kind
+                break
+
+    inputs = ()
+    if kind in INSTRUMENT_KINDS or kind == MODULE:
+        parts = name.split('.')
+        short_name = get_short_name(parts[0])
+        if kind in INSTRUMENT_KINDS and len(parts) > 1:
+            input_names = get_short_name(parts[1])
+            if input_names:
+                inputs = tuple(input_names.split(','))
+
+    return NameInfo(kind, short_name, inputs, name.endswith('[S]'), name.endswith('[C]'))
 
 def is_input(name):
-    return name.startswith('IN[')
+    return describe(name).kind == INPUT
 
 def is_midi_router(name):
-    return name.startswith('MR[')
+    return describe(name).kind == MIDI_ROUTER
 
 def is_audio_router(name):
-    return name.startswith('AR[')
+    return describe(name).kind == AUDIO_ROUTER
 
 def is_global_instrument(name):
-    return name.startswith('GI[')
+    return describe(name).kind == GLOBAL_INSTRUMENT
 
 def is_global_loop_track(name):
-    return name == 'GLOBAL_LOOP'
+    return describe(name).kind == GLOBAL_LOOP
 
 def is_snap_control(name):
-    return get_short_name(name) == 'SNAP_CONTROL'
+    return describe(name).kind == SNAP_CONTROL
 
 def is_module(name):
-    return name.startswith('M[')
+    return describe(name).kind == MODULE
     
 def is_instrument(name):
-    return name.startswith('I[')
+    return describe(name).kind == INSTRUMENT
 
 def is_ex_instrument_track(name):
-    return name.startswith('X[')
+    return describe(name).kind == EX_TRACK
 
 def is_source_track(name):
-    return name.endswith('[S]')
+    return describe(name).is_source
 
 def is_compiled_track(name):
-    return name.endswith('[C]')
+    return describe(name).is_compiled
 
 def is_loop(name):
-    return name.startswith('loop[')
+    return describe(name).kind == LOOP
     
 def get_short_name(name):
-    res = re.search(r"\[([A-Za-z0-9_ ,-.]+)\]", name)
+    res = SHORT_NAME_PATTERN.search(name)
     if res:
-        return re.search(r"\[([A-Za-z0-9_ ,-.]+)\]", name).group(1)
+        return res.group(1)
     else:
         return None
 
 #Clip name: (NAME) COMMAND(1) COMMAND(2) COMMAND
 def parse_clip_name(name):
-    match = re.search('\{([^}]+)', name)
+    match = CLIP_NAME_PATTERN.search(name)
     if match is not None:
         return match.group(1)
     else:
@@ -57,8 +129,56 @@ def parse_clip_commands(name):
     return name.split(" ")
 
 def parse_clip_command_param(command):
-    match = re.search('\(([^)]+)', command)
+    match = CLIP_COMMAND_PARAM_PATTERN.search(command)
     if match is not None:
         return match.group(1)
     else:
-        return None    
\ No newline at end of file
+        return None
+
+#Clip commands and the type of their argument (None for commands without one)
+CLIP_COMMANDS = {
+    'SELECT': None,
+    'SNAP': int,
+    'PLAY': str,
+    'STOP': None,
+    'HOLD': None,
+}
+
+CLIP_COMMAND_PATTERN = re.compile(r'^([A-Z_]+)(?:\(([^()]*)\))?$')
+
+ClipCommand = namedtuple('ClipCommand', ['name', 'arg'])
+
+CLIP_COMMAND_PREFIXES = tuple(CLIP_COMMANDS)
+
+#Compiles a clip name into (commands, errors); words that do not start with a command are ignored,
+#and near misses such as SNAP[1] or SNAP1 are reported as malformed
+def compile_clip_commands(name, snap_count=None):
+    commands = []
+    errors = []
+    for token in parse_clip_commands(name):
+        if not token.startswith(CLIP_COMMAND_PREFIXES):
+            continue
+        match = CLIP_COMMAND_PATTERN.match(token)
+        if not match or match.group(1) not in CLIP_COMMANDS:
+            errors.append('malformed command %s' % token)
+            continue
+        command, arg = match.group(1), match.group(2)
+        arg_type = CLIP_COMMANDS[command]
+        if arg_type is None:
+            if arg is not None:
+                errors.append('%s takes no argument' % command)
+                continue
+        elif not arg:
+            errors.append('%s needs an argument' % command)
+            continue
+        elif arg_type is int:
+            try:
+                arg = int(arg)
+            except ValueError:
+                errors.append('%s(%s): not a number' % (command, arg))
+                continue
+            if snap_count is not None and not 0 <= arg < snap_count:
+                errors.append('%s(%d): no such snap' % (command, arg))
+                continue
+        commands.append(ClipCommand(command, arg))
+    return tuple(commands), errors
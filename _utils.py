@@ -1,6 +1,7 @@
 import functools
 import traceback
 import subprocess
+from _Log import logger, ERROR
 
 def catch_exception(f):
     @functools.wraps(f)
@@ -8,11 +9,12 @@ def catch_exception(f):
         try:
             return f(*args, **kwargs)
         except:
-            args[0].log(traceback.format_exc())
+            logger.log(ERROR, traceback.format_exc())
     return func
 
-def clear_log_file():
-    open('/Users/justin/Library/Preferences/Ableton/Live 10.1.3/Log.txt', 'w').close()
+#Live can hand out different wrappers for the same object, so key dicts by the underlying pointer
+def live_key(obj):
+    return getattr(obj, '_live_ptr', id(obj))
 
 def set_input_routing(track, routing_name):
     for routing in track.available_input_routing_types:
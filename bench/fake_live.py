@@ -0,0 +1,475 @@
+#Synthetic Live Object Model and framework stubs, so that Ebiagi can be run and benchmarked outside of Live
+import sys
+import types
+from itertools import count
+
+_ptrs = count(1)
+
+
+#Observable stand-in for a Live API object. Public attribute writes notify listeners registered through
+#add_{prop}_listener and are counted in LiveObject.stats, so benchmarks can report LOM traffic
+class LiveObject(object):
+
+    stats = {'writes': 0, 'reads': 0}
+
+    def __init__(self, **props):
+        object.__setattr__(self, '_listeners', {})
+        object.__setattr__(self, '_live_ptr', next(_ptrs))
+        for k, v in props.items():
+            object.__setattr__(self, k, v)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+            return
+        LiveObject.stats['writes'] += 1
+        old = self.__dict__.get(name, None)
+        object.__setattr__(self, name, value)
+        if old != value:
+            self.notify(name)
+
+    def notify(self, prop):
+        for listener in list(self._listeners.get(prop, ())):
+            listener()
+
+    def __getattr__(self, name):
+        if name.startswith('add_') and name.endswith('_listener'):
+            prop = name[4:-9]
+            return lambda f: self._listeners.setdefault(prop, []).append(f)
+        if name.startswith('remove_') and name.endswith('_listener'):
+            prop = name[7:-9]
+            return lambda f: self._listeners.get(prop, []).remove(f)
+        if name.endswith('_has_listener'):
+            prop = name[:-13]
+            return lambda f: f in self._listeners.get(prop, [])
+        raise AttributeError(name)
+
+
+class RoutingType(LiveObject):
+    def __init__(self, display_name):
+        super(RoutingType, self).__init__(display_name=display_name)
+
+
+class Parameter(LiveObject):
+    def __init__(self, name, value=0.0, min=0.0, max=127.0, is_quantized=False):
+        super(Parameter, self).__init__(name=name, value=value, min=min, max=max, is_quantized=is_quantized)
+
+
+class Chain(LiveObject):
+    def __init__(self, name, mute=False):
+        super(Chain, self).__init__(name=name, mute=mute)
+
+
+class Device(LiveObject):
+    def __init__(self, name='Device', parameters=(), chains=()):
+        super(Device, self).__init__(name=name, parameters=list(parameters), chains=list(chains))
+
+
+class Clip(LiveObject):
+    def __init__(self, name='', is_midi_clip=True):
+        super(Clip, self).__init__(name=name, is_midi_clip=is_midi_clip, is_audio_clip=not is_midi_clip,
+                                   muted=False, has_envelopes=False)
+        self._notes = []
+
+    def select_all_notes(self):
+        pass
+
+    def get_selected_notes(self):
+        return tuple(self._notes)
+
+    def quantize(self, grid, amount):
+        pass
+
+
+class ClipSlot(LiveObject):
+    def __init__(self, clip=None):
+        super(ClipSlot, self).__init__(clip=clip, has_clip=clip is not None, has_stop_button=True,
+                                       is_playing=False, is_recording=False, is_triggered=False,
+                                       playing_status=0, controls_other_clips=False, color_index=None)
+
+    def fire(self):
+        if self.has_clip:
+            self.is_playing = True
+            self.playing_status = 1
+
+    def stop(self):
+        self.is_playing = False
+        self.playing_status = 0
+
+    def delete_clip(self):
+        self.clip = None
+        self.has_clip = False
+        self.is_playing = False
+        self.playing_status = 0
+
+    def set_clip(self, clip):
+        self.clip = clip
+        self.has_clip = clip is not None
+
+
+class Scene(LiveObject):
+    def __init__(self, name):
+        super(Scene, self).__init__(name=name)
+
+
+class Track(LiveObject):
+    def __init__(self, name, midi=True, audio=False, grouped=False, group_track=None, devices=(),
+                 can_be_armed=True, color_index=69):
+        super(Track, self).__init__(
+            name=name, has_midi_input=midi, has_audio_input=audio, is_grouped=grouped,
+            group_track=group_track, is_foldable=False, devices=list(devices), can_be_armed=can_be_armed,
+            arm=False, current_monitoring_state=1, mute=False, fold_state=0, color_index=color_index,
+            clip_slots=[], input_routing_type=None, output_routing_type=RoutingType('Master'),
+            available_input_routing_types=[], available_output_routing_types=[],
+            playing_slot_index=-1, fired_slot_index=-1)
+        self._data = {}
+
+    def stop_all_clips(self):
+        for slot in self.clip_slots:
+            slot.stop()
+
+    def get_data(self, key, default):
+        return self._data.get(key, default)
+
+    def set_data(self, key, value):
+        self._data[key] = value
+
+
+class BeatTime(object):
+    def __init__(self, bars, beats, sub_division, ticks):
+        self.bars = bars
+        self.beats = beats
+        self.sub_division = sub_division
+        self.ticks = ticks
+
+
+class SongView(LiveObject):
+    def __init__(self):
+        super(SongView, self).__init__(selected_track=None, selected_parameter=None, detail_clip=None)
+
+
+class MixerDevice(LiveObject):
+    def __init__(self):
+        super(MixerDevice, self).__init__(crossfader=Parameter('Crossfader', 0.0, -1.0, 1.0))
+
+
+class Song(LiveObject):
+    def __init__(self):
+        super(Song, self).__init__(tracks=[], scenes=[], view=SongView(), metronome=False,
+                                   master_track=LiveObject(mixer_device=MixerDevice()),
+                                   current_song_time=0.0, is_playing=True, tempo=120.0)
+
+    def get_current_beats_song_time(self):
+        t = self.current_song_time
+        beats = int(t)
+        sub = int((t - beats) * 4)
+        ticks = int(((t - beats) * 4 - sub) * 60)
+        return BeatTime(beats // 4 + 1, beats % 4 + 1, sub + 1, ticks)
+
+    def add_track(self, track, index=None):
+        tracks = list(self.tracks)
+        tracks.insert(len(tracks) if index is None else index, track)
+        for _ in self.scenes:
+            track.clip_slots.append(ClipSlot())
+        self.tracks = tracks
+
+    def add_scene(self, scene, index=None):
+        scenes = list(self.scenes)
+        index = len(scenes) if index is None else index
+        scenes.insert(index, scene)
+        for track in self.tracks:
+            slots = list(track.clip_slots)
+            slots.insert(index, ClipSlot())
+            track.clip_slots = slots
+        self.scenes = scenes
+
+
+#Minimal canonical_parent: logging, messages and scheduled tasks
+class FakeControlSurface(object):
+
+    def __init__(self, song):
+        self._song = song
+        self.logged = []
+        self.scheduled = []
+        self.quiet = True
+
+    def song(self):
+        return self._song
+
+    def log_message(self, message):
+        self.logged.append(message)
+        if not self.quiet:
+            sys.stdout.write('%s\n' % (message,))
+
+    def show_message(self, message):
+        self.log_message(message)
+
+    def schedule_message(self, delay, callback, *a):
+        self.scheduled.append((delay, callback, a))
+
+    def application(self):
+        return LiveObject(view=LiveObject(show_view=lambda name: None))
+
+    #Advances the scheduler by a number of ticks
+    def run_scheduled(self, ticks=1):
+        for _ in range(ticks):
+            due, self.scheduled = self.scheduled, []
+            later = []
+            for delay, callback, a in due:
+                if delay <= 1:
+                    callback(*a)
+                else:
+                    later.append((delay - 1, callback, a))
+            self.scheduled.extend(later)
+
+
+#Framework stubs
+
+class _Slot(object):
+    def __init__(self, owner, event, function):
+        self._owner = owner
+        self._event = event
+        self._function = function
+        self._subject = None
+        self._listener = lambda *a: function(owner, *a)
+
+    def _get_subject(self):
+        return self._subject
+
+    def _set_subject(self, subject):
+        if self._subject is not None:
+            getattr(self._subject, 'remove_%s_listener' % self._event)(self._listener)
+        self._subject = subject
+        if subject is not None:
+            getattr(subject, 'add_%s_listener' % self._event)(self._listener)
+
+    subject = property(_get_subject, _set_subject)
+
+    def __call__(self, *a):
+        return self._function(self._owner, *a)
+
+    def disconnect(self):
+        self.subject = None
+
+
+class _SlotGroup(object):
+    def __init__(self, owner, event, function):
+        self._owner = owner
+        self._event = event
+        self._function = function
+        self._registered = []
+
+    def replace_subjects(self, subjects, identifiers=None):
+        self.disconnect()
+        subjects = list(subjects)
+        identifiers = list(identifiers) if identifiers is not None else [None] * len(subjects)
+        for subject, identifier in zip(subjects, identifiers):
+            self.add_subject(subject, identifier)
+
+    def add_subject(self, subject, identifier=None):
+        ident = subject if identifier is None else identifier
+        listener = lambda *a: self._function(self._owner, *(a + (ident,)))
+        getattr(subject, 'add_%s_listener' % self._event)(listener)
+        self._registered.append((subject, listener))
+
+    def remove_subject(self, subject):
+        for s, listener in list(self._registered):
+            if s is subject:
+                getattr(s, 'remove_%s_listener' % self._event)(listener)
+                self._registered.remove((s, listener))
+
+    def has_subject(self, subject):
+        return any(s is subject for s, _ in self._registered)
+
+    def disconnect(self):
+        for subject, listener in self._registered:
+            getattr(subject, 'remove_%s_listener' % self._event)(listener)
+        self._registered = []
+
+
+class _SlotDescriptor(object):
+    def __init__(self, event, function, factory):
+        self._event = event
+        self._function = function
+        self._factory = factory
+        self._attr = '_slot_%s_%d' % (function.__name__, id(self))
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        slot = obj.__dict__.get(self._attr)
+        if slot is None:
+            slot = self._factory(obj, self._event, self._function)
+            obj.__dict__[self._attr] = slot
+            obj.__dict__.setdefault('_registered_slots', []).append(slot)
+        return slot
+
+
+def subject_slot(event):
+    return lambda f: _SlotDescriptor(event, f, _Slot)
+
+
+def subject_slot_group(event):
+    return lambda f: _SlotDescriptor(event, f, _SlotGroup)
+
+
+class _Tasks(object):
+    def __init__(self):
+        self.pending = []
+
+    def add(self, task):
+        self.pending.append(task)
+
+    def run(self):
+        pending, self.pending = self.pending, []
+        for task in pending:
+            task()
+
+
+class ControlSurfaceComponent(object):
+    canonical_parent = None
+
+    def __init__(self, *a, **k):
+        self._tasks = _Tasks()
+
+    def disconnect(self):
+        for slot in self.__dict__.get('_registered_slots', ()):
+            slot.disconnect()
+
+
+class ClyphXComponentBase(ControlSurfaceComponent):
+    pass
+
+
+_clients = []
+
+
+def add_client(client):
+    _clients.append(client)
+
+
+def remove_client(client):
+    if client in _clients:
+        _clients.remove(client)
+
+
+def tick_clients():
+    for client in list(_clients):
+        client.on_tick()
+        client._tasks.run()
+
+
+class UserActionsBase(object):
+    canonical_parent = None
+
+    def __init__(self, *a, **k):
+        self.actions = {}
+
+    def add_global_action(self, name, function):
+        self.actions[name] = function
+
+
+#Registers the framework stubs and binds components to song
+def install(song):
+    surface = FakeControlSurface(song)
+    ControlSurfaceComponent.canonical_parent = surface
+    UserActionsBase.canonical_parent = surface
+    del _clients[:]
+
+    def module(name, **attrs):
+        m = sys.modules.get(name) or types.ModuleType(name)
+        m.__dict__.update(attrs)
+        sys.modules[name] = m
+        return m
+
+    module('_Framework')
+    module('_Framework.ControlSurfaceComponent', ControlSurfaceComponent=ControlSurfaceComponent)
+    module('_Framework.SubjectSlot', subject_slot=subject_slot, subject_slot_group=subject_slot_group)
+    module('ClyphX_Pro')
+    module('ClyphX_Pro.clyphx_pro')
+    module('ClyphX_Pro.clyphx_pro.ClyphXComponentBase', ClyphXComponentBase=ClyphXComponentBase,
+           add_client=add_client, remove_client=remove_client)
+    module('ClyphX_Pro.clyphx_pro.UserActionsBase', UserActionsBase=UserActionsBase)
+    return surface
+
+
+#Set generator
+
+INPUTS = ('A', 'B', 'C', 'D')
+AUDIO_INPUTS = ('MIC',)
+
+
+def _router(name, inputs):
+    chains = [Chain(i) for i in inputs] + [Chain('THRU')]
+    return Track(name, devices=[Device('Router', [Parameter('On', 1.0, 0.0, 1.0)], chains)])
+
+
+def _instrument(name, macro_count=16):
+    params = [Parameter('Device On', 1.0, 0.0, 1.0)] + \
+        [Parameter('Macro %d' % (i + 1), 0.0, 0.0, 127.0) for i in range(macro_count)]
+    return Device('Rack', params)
+
+
+#Generates a song laid out per the Ebiagi naming conventions
+def build_song(modules=4, instruments=8, loops=16, global_instruments=2, ex_tracks=1, clips=True,
+               snaps=True):
+    song = Song()
+    tracks = []
+    for name in INPUTS:
+        tracks.append(Track('IN[%s]' % name, midi=True))
+    for name in AUDIO_INPUTS:
+        tracks.append(Track('IN[%s]' % name, midi=False, audio=True))
+    midi_routers = global_instruments + 1 + instruments
+    for i in range(midi_routers):
+        tracks.append(_router('MR[%d]' % (i + 1), INPUTS))
+    for i in range(global_instruments + instruments):
+        tracks.append(_router('AR[%d]' % (i + 1), AUDIO_INPUTS))
+    for g in range(global_instruments):
+        tracks.append(Track('GI[G%d].[A,MIC]' % (g + 1), audio=True, devices=[_instrument('G')]))
+    tracks.append(Track('SC[SNAP_CONTROL].[%s]' % INPUTS[0], devices=[_instrument('SNAP')]))
+    tracks.append(Track('GLOBAL_LOOP', midi=False, audio=True))
+    colors = (9, 12, 39, 61, 59, 1, 20, 24)
+    for m in range(modules):
+        group = Track('M[M%d]' % (m + 1), color_index=colors[m % len(colors)])
+        group.is_foldable = True
+        tracks.append(group)
+        for i in range(instruments):
+            inputs = INPUTS[i % len(INPUTS)]
+            if i % 3 == 0:
+                inputs += ',MIC'
+            tracks.append(Track('I[M%dI%d].[%s]' % (m + 1, i + 1, inputs), audio=',MIC' in inputs, grouped=True,
+                                group_track=group, devices=[_instrument('I')], color_index=colors[i % len(colors)]))
+            for x in range(ex_tracks):
+                suffix = '[S]' if x % 2 == 0 else '[C]'
+                tracks.append(Track('X[M%dI%dX%d]%s' % (m + 1, i + 1, x + 1, suffix), grouped=True,
+                                    group_track=group))
+    tracks.append(Track('OUT'))
+
+    scenes = [Scene('STOPCLIP')] + [Scene('loop[%d]' % (l + 1)) for l in range(loops)]
+    song.scenes = scenes
+    for track in tracks:
+        track.clip_slots = [ClipSlot() for _ in scenes]
+        track.available_input_routing_types = [RoutingType('No Input')] + \
+            [RoutingType(t.name) for t in tracks if t.name.startswith('MR[') or t.name.startswith('AR[')]
+        track.available_output_routing_types = [RoutingType('Master')] + \
+            [RoutingType(t.name) for t in tracks if t.name.startswith('MR[') or t.name.startswith('AR[')]
+    song.tracks = tracks
+
+    if clips:
+        for track in tracks:
+            if track.name.startswith('I['):
+                for s in range(1, len(scenes), 3):
+                    track.clip_slots[s].set_clip(Clip('{c%d} SELECT HOLD' % s))
+                track.clip_slots[2].set_clip(Clip('{v2} PLAY(c1) SNAP(1)'))
+    if snaps:
+        for track in tracks:
+            if track.name.startswith('M['):
+                instr = [t for t in tracks if t.group_track is track and t.name.startswith('I[')]
+                data = [[], [], [], [], [], []]
+                for s in range(6):
+                    for t in instr[:4]:
+                        for p in range(1, 5):
+                            data[s].append({'instr_name': t.name.split('.')[0][2:-1], 'param_index': p,
+                                            'param_value': float(s * 10 + p)})
+                track.set_data('snaps', data)
+    return song
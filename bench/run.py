@@ -0,0 +1,195 @@
+#Offline benchmarks on generated sets, written to a JSON file to compare between releases
+#Usage: python bench/run.py [--sizes 4x8x16,16x32x64] [--repeat 3] [--out bench/results.json]
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+import fake_live
+
+#Modules x instruments x loop scenes
+DEFAULT_SIZES = '4x8x16,16x32x64'
+
+
+def parse_size(size):
+    modules, instruments, loops = [int(n) for n in size.lower().split('x')]
+    return {'modules': modules, 'instruments': instruments, 'loops': loops}
+
+
+class Bench(object):
+
+    def __init__(self, size, repeat):
+        self.size = size
+        self.repeat = repeat
+        self.song = fake_live.build_song(**size)
+        self.surface = fake_live.install(self.song)
+
+        #Imported once the framework stubs are installed
+        from _Set import Set
+        from _Metrics import Histogram, timer
+        self._Set = Set
+        self._Histogram = Histogram
+        self._timer = timer
+        self.set = None
+
+    #Times each call and counts the LOM writes they make; before runs untimed ahead of each call
+    def measure(self, calls, before=None):
+        histogram = self._Histogram()
+        fake_live.LiveObject.stats['writes'] = 0
+        for fn in calls:
+            if before:
+                before()
+            start = self._timer()
+            fn()
+            histogram.record((self._timer() - start) * 1000)
+        result = histogram.summary()
+        result['lom_writes'] = fake_live.LiveObject.stats['writes']
+        return result
+
+    def new_set(self):
+        self.set = self._Set()
+
+    #Lets the last Set finish the work it schedules for idle ticks, then drops it
+    def drop_set(self):
+        self.surface.run_scheduled()
+        if self.set:
+            self.set.disconnect()
+            self.set = None
+
+    def bench_load(self):
+        result = self.measure([self.new_set] * self.repeat, self.drop_set)
+        self.surface.run_scheduled()
+        return result
+
+    def bench_switch(self):
+        s = self.set
+        modules = range(len(s.modules))
+        order = [(i + 1) % len(modules) for i in modules] * self.repeat
+
+        def switch(index):
+            def fn():
+                with s.batch():
+                    s.activate_module(index)
+            return fn
+
+        #Idle ticks between switches, where the Set prepares the next one
+        return self.measure([switch(index) for index in order], self.surface.run_scheduled)
+
+    def bench_get_state(self):
+        s = self.set
+        from _GetState import get_state
+
+        def uncached():
+            s.state_changed()
+            get_state(s)
+
+        def one_loop():
+            s.loop_changed('1')
+            get_state(s)
+
+        return {
+            'full': self.measure([uncached] * (10 * self.repeat)),
+            'one_loop': self.measure([one_loop] * (10 * self.repeat)),
+            'cached': self.measure([lambda: get_state(s)] * (100 * self.repeat)),
+        }
+
+    def bench_routers(self):
+        s = self.set
+        calls = []
+        for _ in range(self.repeat):
+            for i in range(len(s.active_module.instruments)):
+                calls.append(lambda i=i: s.select_instrument(i))
+            for i in range(len(s.active_module.instruments)):
+                calls.append(lambda i=i: s.deselect_instrument(i))
+        return self.measure(calls)
+
+    def bench_snaps(self):
+        s = self.set
+        song = self.song
+        module = s.active_module
+        instrument = module.instruments[-1]
+        params = instrument._track.devices[0].parameters[1:]
+        song.view.selected_track = instrument._track
+
+        def assign(param):
+            def fn():
+                song.view.selected_parameter = param
+                s.assign_snap(0)
+            return fn
+
+        #Assigning a param twice removes it again, so each round leaves the snap as it was
+        calls = [assign(param) for param in params] * (2 * self.repeat)
+        return {
+            'assign': self.measure(calls),
+            'save': self.measure([lambda: (module._save_snaps(), module.flush_snaps())] * (10 * self.repeat)),
+        }
+
+    def bench_ramp(self):
+        s = self.set
+        song = self.song
+        snap_control = s.snap_control
+        song.is_playing = True
+        song.current_song_time = 0.0
+        s.select_snap(1)
+        s.deselect_snap(1)
+        for snap_param in s.active_module.snaps[1].snap_params.values():
+            snap_param.param.value = snap_param.param.min
+        s.recall_snap(4 * self.repeat)
+
+        def tick():
+            song.current_song_time += 0.05
+            fake_live.tick_clients()
+
+        result = self.measure([tick] * (100 * self.repeat))
+        snap_control._ramps = {}
+        return result
+
+    def run(self):
+        results = {'load': self.bench_load()}
+        for name in ('switch', 'get_state', 'routers', 'snaps', 'ramp'):
+            results[name] = getattr(self, 'bench_' + name)()
+        self.set.disconnect()
+        return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE).strip().decode('utf-8')
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Ebiagi on generated sets')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='comma separated modules x instruments x loops')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--out', default=os.path.join(HERE, 'results.json'))
+    args = parser.parse_args()
+
+    report = {
+        'revision': git_revision(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'unit': 'ms',
+        'sizes': {},
+    }
+    for size in args.sizes.split(','):
+        sys.stdout.write('Running %s...\n' % size)
+        report['sizes'][size] = Bench(parse_size(size), args.repeat).run()
+
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    sys.stdout.write('Results written to %s\n' % args.out)
+
+
+if __name__ == '__main__':
+    main()